@@ -4,14 +4,24 @@ Route module for the API
 """
 from os import getenv
 from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from api.v1 import compression, json_provider
+from flask import Flask, jsonify, abort, request, g
 from flask_cors import CORS
+from math import ceil
+from models.stats import COUNTERS
 import os
 
 app = Flask(__name__)
+# orjson-backed jsonify when available; API_JSON=stdlib opts out
+json_provider.install(app)
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
+# Opt-in gzip/brotli compression of the larger responses
+if getenv("API_COMPRESSION", "0") == "1":
+    compression.install(app, int(getenv("API_COMPRESSION_MIN_SIZE", 1024)),
+                        int(getenv("API_COMPRESSION_LEVEL", 6)))
+
 auth = None
 AUTH_TYPE = os.getenv("AUTH_TYPE")
 
@@ -32,6 +42,51 @@ elif AUTH_TYPE == "session_db_auth":
     from api.v1.auth.session_db_auth import SessionDBAuth
     auth = SessionDBAuth()
 
+# Throttle of the authentication attempts
+limiter = None
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND")
+
+if RATE_LIMIT_BACKEND in ("memory", "sqlite"):
+    from api.v1.rate_limit import (LOGIN_PATH, RateLimiter, MemoryBackend,
+                                   SQLiteBackend, attempt_keys)
+    if RATE_LIMIT_BACKEND == "memory":
+        backend = MemoryBackend(int(getenv("RATE_LIMIT_MAX_KEYS", 100000)))
+    else:
+        backend = SQLiteBackend(getenv("RATE_LIMIT_DB", ".rate_limit.db"))
+    limiter = RateLimiter(backend,
+                          float(getenv("RATE_LIMIT_PER_MINUTE", 10)),
+                          int(getenv("RATE_LIMIT_BURST", 10)))
+
+# Opt-in per-phase timings, exposed on GET /api/v1/metrics
+if getenv("API_METRICS", "0") == "1":
+    from api.v1.instrumentation import install
+    install(app, auth)
+
+# Change events of the models, appended as NDJSON for other processes
+if getenv("EVENTS_FILE"):
+    from models.events import BUS, FileSink
+    FileSink(BUS, getenv("EVENTS_FILE")).start()
+
+# Runtime cProfile captures, driven by /api/v1/profiler or SIGUSR1
+if getenv("PROFILER_TOKEN"):
+    from api.v1.profiler import install as install_profiler
+    install_profiler(app)
+
+
+def warm_up():
+    """
+    Loads the user data now instead of on the first request that needs it.
+    Called at import with API_WARM_UP=1, or from a server hook such as
+    gunicorn's post_worker_init.
+    """
+    from models.user import User
+    User.ensure_loaded()
+
+
+if getenv("API_WARM_UP", "0") == "1":
+    warm_up()
+
+
 @app.before_request
 def before_request_handler():
     """
@@ -40,21 +95,53 @@ def before_request_handler():
     if auth is None:
         return
 
+    if limiter is not None:
+        # Rejected before any user lookup or password hashing
+        keys = attempt_keys(request, auth)
+        retry_after = limiter.check(keys) if keys else None
+        if retry_after is not None:
+            COUNTERS.incr('auth_throttled')
+            return jsonify({"error": "Too many requests"}), 429, \
+                {"Retry-After": str(ceil(retry_after))}
+        g.rate_limit_keys = keys
+
     request.current_user = auth.current_user(request)
     excluded = [
         '/api/v1/status/',
         '/api/v1/unauthorized/',
         '/api/v1/forbidden/',
+        '/api/v1/profiler/',
         '/api/v1/auth_session/login/'
     ]
+    if getenv("METRICS_TOKEN"):
+        # Scraped with X-Metrics-Token instead of user credentials
+        excluded.append('/api/v1/metrics/')
 
     if auth.require_auth(request.path, excluded):
         cookie = auth.session_cookie(request)
         if auth.authorization_header(request) is None and cookie is None:
             abort(401, description="Unauthorized")
         if request.current_user is None:
+            COUNTERS.incr('auth_failures')
             abort(403, description="Forbidden")
 
+@app.after_request
+def after_request_handler(response):
+    """
+    Charge the throttle for a failed authentication: anything but valid
+    credentials or a successful login. Wrong credentials sent to an
+    excluded path still answer 200 but are charged. Successful attempts
+    write nothing.
+    """
+    keys = g.pop('rate_limit_keys', None)
+    if not keys:
+        return response
+    logged_in = request.path.rstrip('/') == LOGIN_PATH \
+        and request.method == 'POST' and response.status_code == 200
+    if getattr(request, 'current_user', None) is None and not logged_in:
+        limiter.charge(keys)
+    return response
+
 @app.errorhandler(404)
 def not_found(error) -> str:
     """ Not found handler
@@ -73,7 +160,14 @@ def forbidden(error) -> str:
     """
     return jsonify({"error": "Forbidden"}), 403
 
+@app.errorhandler(412)
+def precondition_failed(error) -> str:
+    """ Stale If-Match handler
+    """
+    return jsonify({"error": "Precondition failed"}), 412
+
 if __name__ == "__main__":
     host = getenv("API_HOST", "0.0.0.0")
     port = getenv("API_PORT", "5000")
+    warm_up()
     app.run(host=host, port=port)
@@ -10,6 +10,65 @@ from typing import Tuple, TypeVar
 from api.v1.auth.auth import Auth
 from models.user import User
 
+BASIC_PREFIX = "Basic "
+
+try:
+    binascii.a2b_base64(b"", strict_mode=True)
+
+    def b64decode_strict(value: str) -> bytes:
+        """ Decodes base64, rejecting any non-alphabet or misplaced byte. """
+        return binascii.a2b_base64(value, strict_mode=True)
+except TypeError:  # Python < 3.11
+    def b64decode_strict(value: str) -> bytes:
+        """ Decodes base64, rejecting any non-alphabet or misplaced byte. """
+        return base64.b64decode(value, validate=True)
+
+
+def decode_base64_utf8(value: str) -> str:
+    """
+    Strictly decodes a base64 string holding UTF-8 text.
+
+    Args:
+        value (str): The base64 string; characters outside the base64
+            alphabet and missing padding are rejected.
+
+    Returns:
+        str: The decoded text, or None if the input is not valid.
+    """
+    try:
+        return b64decode_strict(value).decode('utf-8')
+    except (binascii.Error, ValueError):
+        # ValueError also covers non-ASCII input and UnicodeDecodeError
+        return None
+
+
+def parse_basic_authorization(authorization_header) -> Tuple[str, str]:
+    """
+    Parses a Basic Authorization header in a single pass: checks the
+    scheme, strictly decodes the base64 payload in C and splits the
+    credentials, so malformed headers are rejected before any lookup.
+
+    Args:
+        authorization_header: The Authorization header.
+
+    Returns:
+        Tuple[str, str]: The user's email and password, or (None, None) if
+        the header is not valid Basic credentials.
+    """
+    if type(authorization_header) is not str \
+            or not authorization_header.startswith(BASIC_PREFIX):
+        return None, None
+    try:
+        decoded = b64decode_strict(
+            authorization_header[len(BASIC_PREFIX):]).decode('utf-8')
+    except (binascii.Error, ValueError):
+        return None, None
+    email, sep, password = decoded.partition(':')
+    if not sep:
+        return None, None
+    return email, password
+
+
 class BasicAuth(Auth):
     """
     BasicAuth class that inherits from Auth for managing Basic Authentication.
@@ -27,9 +86,9 @@ class BasicAuth(Auth):
         """
         if authorization_header is None or not isinstance(authorization_header, str):
             return None
-        if not authorization_header.startswith("Basic "):
+        if not authorization_header.startswith(BASIC_PREFIX):
             return None
-        return authorization_header[len("Basic "):]
+        return authorization_header[len(BASIC_PREFIX):]
 
     def decode_base64_authorization_header(self, base64_authorization_header: str) -> str:
         """
@@ -43,11 +102,7 @@ class BasicAuth(Auth):
         """
         if base64_authorization_header is None or not isinstance(base64_authorization_header, str):
             return None
-        try:
-            decoded_bytes = base64.b64decode(base64_authorization_header)
-            return decoded_bytes.decode('utf-8')
-        except (binascii.Error, UnicodeDecodeError):
-            return None
+        return decode_base64_utf8(base64_authorization_header)
 
     def extract_user_credentials(self, decoded_base64_authorization_header: str) -> Tuple[str, str]:
         """
@@ -66,6 +121,19 @@ class BasicAuth(Auth):
             return credentials[0], credentials[1]
         return None, None
 
+    def credentials_from_header(self, authorization_header: str) -> Tuple[str, str]:
+        """
+        Extracts the user credentials from an Authorization header in one
+        pass; equivalent to chaining the three extraction methods above.
+
+        Args:
+            authorization_header (str): The Authorization header.
+
+        Returns:
+            Tuple[str, str]: The user's email and password as a tuple, or (None, None) if invalid.
+        """
+        return parse_basic_authorization(authorization_header)
+
     def user_object_from_credentials(self, user_email: str, user_pwd: str) -> TypeVar('User'):
         """
         Retrieves a user based on the user's authentication credentials.
@@ -83,7 +151,9 @@ class BasicAuth(Auth):
             return None
         try:
             users = User.search({'email': user_email})
-            if not users or not users[0].is_valid_password(user_pwd):
+            # Basic is the only login with AUTH_TYPE=basic_auth: upgrade here
+            if not users or not users[0].is_valid_password(user_pwd,
+                                                           upgrade=True):
                 return None
             return users[0]
         except Exception:
@@ -100,8 +170,8 @@ class BasicAuth(Auth):
             User: The authenticated user, or None if authentication fails.
         """
         auth_header = self.authorization_header(request)
-        b64_auth_token = self.extract_base64_authorization_header(auth_header)
-        auth_token = self.decode_base64_authorization_header(b64_auth_token)
-        email, password = self.extract_user_credentials(auth_token)
+        email, password = self.credentials_from_header(auth_header)
+        if email is None:
+            return None
         return self.user_object_from_credentials(email, password)
 
@@ -4,7 +4,10 @@ Definition of the SessionAuth class.
 This class provides the foundation for session-based authentication.
 """
 
+from os import getenv
 from .auth import Auth
+from .session_token import SessionSigner
+from models.stats import COUNTERS
 from models.user import User
 from uuid import uuid4  # Importing uuid4
 
@@ -14,6 +17,34 @@ class SessionAuth(Auth):
 
     user_id_by_session_id = {}
 
+    def __init__(self):
+        """
+        Initializes the session store. With SESSION_MODE=signed, session IDs
+        are signed tokens valid for SESSION_DURATION seconds (0 for no expiry)
+        and are checked without a lookup.
+        """
+        self.signer = None
+        if getenv("SESSION_MODE") == "signed":
+            self.signer = SessionSigner(
+                ttl=int(getenv("SESSION_DURATION", 86400)))
+
+    def session_version(self, user_id: str) -> int:
+        """
+        Returns the current session version of a user (signed mode).
+
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            int: The session version, persisted with the user and
+            incremented by destroying a session; None if the user does not
+            exist.
+        """
+        user = User.get(user_id)
+        if user is None:
+            return None
+        return getattr(user, '_session_version', 0)
+
     def create_session(self, user_id: str = None) -> str:
         """
         Creates a session ID for a user with the provided user_id.
@@ -26,8 +57,13 @@ class SessionAuth(Auth):
         """
         if user_id is None or not isinstance(user_id, str):
             return None
+        COUNTERS.incr('sessions_created')
+        if self.signer is not None:
+            return self.signer.issue(user_id,
+                                     self.session_version(user_id) or 0)
         session_id = str(uuid4())
         self.user_id_by_session_id[session_id] = user_id
+        COUNTERS.incr('active_sessions')
         return session_id
 
     def user_id_for_session_id(self, session_id: str = None) -> str:
@@ -42,6 +78,12 @@ class SessionAuth(Auth):
         """
         if session_id is None or not isinstance(session_id, str):
             return None
+        if self.signer is not None:
+            claims = self.signer.verify(session_id)
+            if claims is None or \
+                    claims[1] != self.session_version(claims[0]):
+                return None
+            return claims[0]
         return self.user_id_by_session_id.get(session_id)
 
     def current_user(self, request=None) -> User:
@@ -79,7 +121,17 @@ class SessionAuth(Auth):
         session_cookie = self.session_cookie(request)
         if session_cookie is None:
             return False
-        if session_cookie not in self.user_id_by_session_id:
+        if self.signer is not None:
+            user_id = self.user_id_for_session_id(session_cookie)
+            user = User.get(user_id) if user_id is not None else None
+            if user is None:
+                return False
+            user._session_version = getattr(user, '_session_version', 0) + 1
+            user.save(touch=False)
+            COUNTERS.incr('sessions_destroyed')
+            return True
+        if self.user_id_by_session_id.pop(session_cookie, None) is None:
             return False  # Check if the session exists
-        del self.user_id_by_session_id[session_cookie]
+        COUNTERS.incr('sessions_destroyed')
+        COUNTERS.incr('active_sessions', -1)
         return True
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Definition of the SessionSigner class.
+Signed session tokens carry the user ID, a session version and an expiry
+time under an HMAC-SHA256 signature, so they are checked without a lookup.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import time
+from typing import Optional, Tuple
+
+
+class SessionSigner:
+    """ Issues and verifies signed, expiring session tokens. """
+
+    def __init__(self, secret: bytes = None, ttl: int = 86400):
+        """
+        Initializes the signer.
+
+        Args:
+            secret (bytes): The signing key. Defaults to SESSION_SECRET, then
+                to a random key valid for this process only.
+            ttl (int): The lifetime of a token in seconds, 0 for no expiry.
+        """
+        if secret is None:
+            env_secret = os.getenv("SESSION_SECRET")
+            secret = env_secret.encode() if env_secret else os.urandom(32)
+        self._secret = secret
+        self.ttl = ttl
+
+    def _sign(self, payload: str) -> str:
+        """ Returns the URL-safe signature of a payload. """
+        digest = hmac.new(self._secret, payload.encode(), hashlib.sha256)
+        return base64.urlsafe_b64encode(digest.digest()).rstrip(b"=").decode()
+
+    def issue(self, user_id: str, version: int) -> str:
+        """
+        Issues a token for a user.
+
+        Args:
+            user_id (str): The ID of the user.
+            version (int): The current session version of the user.
+
+        Returns:
+            str: The token, `<user_id>.<version>.<expires>.<signature>`.
+        """
+        expires = int(time.time()) + self.ttl if self.ttl else 0
+        payload = "{}.{}.{}".format(user_id, version, expires)
+        return "{}.{}".format(payload, self._sign(payload))
+
+    def verify(self, token: str) -> Optional[Tuple[str, int]]:
+        """
+        Checks the signature and the expiry of a token.
+
+        Args:
+            token (str): The token to check.
+
+        Returns:
+            Tuple[str, int]: The user ID and the session version carried by
+            the token, or None if it is malformed, forged or expired.
+        """
+        if not isinstance(token, str):
+            return None
+        parts = token.rsplit(".", 3)
+        if len(parts) != 4:
+            return None
+        user_id, version, expires, signature = parts
+        payload = "{}.{}.{}".format(user_id, version, expires)
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            version, expires = int(version), int(expires)
+        except ValueError:
+            return None
+        if expires and expires < time.time():
+            return None
+        return user_id, version
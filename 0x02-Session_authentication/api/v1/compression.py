@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Response compression for the API.
+Responses of a compressible type larger than a threshold are compressed
+with the best encoding the client accepts: brotli when the brotli package
+is installed, else gzip. A compressed response gets its own ETag, the one
+of the identity body suffixed with the encoding. Streamed responses (e.g.
+the NDJSON export) are left alone.
+"""
+
+import gzip
+from typing import List
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson',
+                      'text/html', 'text/plain')
+ENCODINGS = ('br', 'gzip')
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    Returns the ETag of a representation compressed with an encoding.
+
+    Args:
+        etag (str): The ETag of the identity representation.
+        encoding (str): br or gzip.
+
+    Returns:
+        str: The ETag, e.g. 5-gzip.
+    """
+    return "{}-{}".format(etag, encoding)
+
+
+def etag_variants(etag: str) -> List[str]:
+    """
+    Returns the ETags a client may hold for a resource: the one of the
+    identity body and those of its compressed forms.
+
+    Args:
+        etag (str): The ETag of the identity representation.
+
+    Returns:
+        List[str]: The ETags, the identity one first.
+    """
+    return [etag] + [encoded_etag(etag, encoding) for encoding in ENCODINGS]
+
+
+class Compressor:
+    """
+    after_request hook compressing the eligible responses.
+    """
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6,
+                 brotli_quality: int = 4):
+        """
+        Initializes the compressor.
+
+        Args:
+            min_size (int): The smallest body, in bytes, worth compressing.
+            gzip_level (int): The gzip compression level (1-9).
+            brotli_quality (int): The brotli quality (0-11).
+        """
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = (['br'] if brotli is not None else []) + ['gzip']
+
+    def encoding_for(self, accept_encodings) -> str:
+        """
+        Negotiates the encoding from the Accept-Encoding header.
+
+        Args:
+            accept_encodings: The parsed Accept-Encoding header.
+
+        Returns:
+            str: The chosen encoding, or None to send the body as is.
+        """
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        """
+        Compresses a body.
+
+        Args:
+            data (bytes): The body.
+            encoding (str): br or gzip.
+
+        Returns:
+            bytes: The compressed body.
+        """
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def __call__(self, response):
+        """
+        Compresses the response if it is eligible.
+
+        Args:
+            response: The response of the view.
+
+        Returns:
+            The same response, compressed or not.
+        """
+        if response.mimetype not in COMPRESSIBLE_TYPES \
+                or response.direct_passthrough or response.is_streamed \
+                or 'Content-Encoding' in response.headers \
+                or not 200 <= response.status_code < 300:
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.content_length is not None \
+                and response.content_length < self.min_size:
+            return response
+        encoding = self.encoding_for(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        response.set_data(self.compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None:
+            # Caches must not mix up the bodies of different encodings
+            response.set_etag(encoded_etag(etag, encoding), weak)
+        return response
+
+
+def install(app, min_size: int = 1024, gzip_level: int = 6) -> Compressor:
+    """
+    Compresses the responses of an application.
+
+    Args:
+        app: The Flask application.
+        min_size (int): The smallest body, in bytes, worth compressing.
+        gzip_level (int): The gzip compression level (1-9).
+
+    Returns:
+        Compressor: The installed hook.
+    """
+    compressor = Compressor(min_size, gzip_level)
+    app.after_request(compressor)
+    return compressor
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Instrumentation module for the API.
+This module records how long each request spends in the auth, store,
+persistence, serialization and handler phases, aggregates the timings into
+histograms and renders them in the Prometheus text format.
+
+Nothing is wrapped until `install` is called, so a disabled API pays no
+per-request cost.
+"""
+
+import functools
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+from flask import g, has_request_context
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PHASES = ('request', 'auth', 'store', 'persistence', 'serialization',
+          'handler')
+
+
+class Histogram:
+    """ Fixed-bucket histogram of durations in seconds. """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        """
+        Initializes an empty histogram.
+
+        Args:
+            buckets (Tuple[float, ...]): The sorted bucket upper bounds.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Adds a duration to the histogram.
+
+        Args:
+            value (float): The duration in seconds.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """
+        Returns the cumulative counts per bucket, `+Inf` included.
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append(("{:g}".format(bound), total))
+        result.append(("+Inf", total + self.counts[-1]))
+        return result
+
+
+class Metrics:
+    """ Registry of the per-phase histograms. """
+
+    def __init__(self):
+        """ Initializes a disabled registry. """
+        self.enabled = False
+        self._lock = Lock()
+        self._histograms = {phase: Histogram() for phase in PHASES}
+
+    def observe(self, phase: str, value: float) -> None:
+        """
+        Records a duration for a phase.
+
+        Args:
+            phase (str): One of PHASES.
+            value (float): The duration in seconds.
+        """
+        with self._lock:
+            self._histograms[phase].observe(value)
+
+    def render(self) -> str:
+        """
+        Renders the histograms in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        name = "api_phase_duration_seconds"
+        lines = [
+            "# HELP {} Time spent by a request in each phase.".format(name),
+            "# TYPE {} histogram".format(name),
+        ]
+        with self._lock:
+            for phase in PHASES:
+                histogram = self._histograms[phase]
+                for bound, count in histogram.cumulative():
+                    lines.append('{}_bucket{{phase="{}",le="{}"}} {}'.format(
+                        name, phase, bound, count))
+                lines.append('{}_sum{{phase="{}"}} {!r}'.format(
+                    name, phase, histogram.sum))
+                lines.append('{}_count{{phase="{}"}} {}'.format(
+                    name, phase, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def record(phase: str, elapsed: float) -> None:
+    """
+    Adds a duration to the current request, or straight to the histograms
+    when called outside of a request (e.g. the initial file load).
+
+    Args:
+        phase (str): One of PHASES.
+        elapsed (float): The duration in seconds.
+    """
+    if has_request_context():
+        timings = g.get('_phase_timings')
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + elapsed
+            return
+    METRICS.observe(phase, elapsed)
+
+
+def timed(phase: str, func: Callable) -> Callable:
+    """
+    Wraps a callable so that its duration is recorded for a phase.
+
+    Args:
+        phase (str): One of PHASES.
+        func (Callable): The callable to wrap.
+
+    Returns:
+        Callable: The timed callable.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(phase, perf_counter() - start)
+    return wrapper
+
+
+def _time_classmethod(cls: type, name: str, phase: str) -> None:
+    """ Replaces a classmethod of `cls` by its timed version. """
+    func = getattr(cls, name).__func__
+    setattr(cls, name, classmethod(timed(phase, func)))
+
+
+def start_request() -> None:
+    """ Opens the timings of the current request. """
+    g._phase_timings = {}
+    g._request_start = perf_counter()
+
+
+def finish_request(error=None) -> None:
+    """ Flushes the timings of the current request to the histograms. """
+    timings = g.pop('_phase_timings', None)
+    if timings is None:
+        return
+    timings['request'] = perf_counter() - g.pop('_request_start')
+    for phase, elapsed in timings.items():
+        METRICS.observe(phase, elapsed)
+
+
+def install(app, auth=None) -> None:
+    """
+    Enables the instrumentation on an application.
+
+    Args:
+        app: The Flask application, with all its blueprints registered.
+        auth: The authentication instance of the application, if any.
+    """
+    from models.base import Base
+
+    if auth is not None:
+        auth.current_user = timed('auth', auth.current_user)
+    _time_classmethod(Base, 'search', 'store')
+    _time_classmethod(Base, 'get', 'store')
+    _time_classmethod(Base, 'load_from_file', 'persistence')
+    _time_classmethod(Base, 'save_to_file', 'persistence')
+
+    provider = getattr(app, 'json', None)
+    if provider is not None and hasattr(provider, 'response'):
+        provider.response = timed('serialization', provider.response)
+    else:
+        import flask.json
+        flask.json.dumps = timed('serialization', flask.json.dumps)
+
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint != 'static':
+            app.view_functions[endpoint] = timed('handler', view)
+
+    # Run first, so the request timing covers the authentication filter
+    app.before_request_funcs.setdefault(None, []).insert(0, start_request)
+    app.teardown_request(finish_request)
+    METRICS.enabled = True
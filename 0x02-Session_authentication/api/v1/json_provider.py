@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Fast JSON serialization for the API.
+With orjson installed, `ORJSONProvider` replaces Flask's stdlib-based JSON
+provider (Flask >= 2.2) and `dumps` is used by the streaming views.
+Without it, or with API_JSON=stdlib, everything falls back to the json
+module and the output is unchanged.
+"""
+
+import json
+from os import getenv
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask < 2.2: no pluggable provider
+    DefaultJSONProvider = None
+
+USE_ORJSON = orjson is not None and getenv("API_JSON", "orjson") == "orjson"
+
+if orjson is not None:
+    # Same key order as Flask's default; datetimes go through `default`
+    ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | \
+        orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def dumps(obj) -> str:
+    """
+    Serializes an object compactly.
+
+    Args:
+        obj: A JSON-serializable object.
+
+    Returns:
+        str: The JSON text.
+    """
+    if USE_ORJSON:
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+    return json.dumps(obj)
+
+
+if DefaultJSONProvider is not None:
+    class ORJSONProvider(DefaultJSONProvider):
+        """
+        JSON provider serializing with orjson. Calls with extra options
+        (indent, separators...) and pretty-printed debug responses keep
+        using the json module.
+        """
+
+        def dumps(self, obj, **kwargs) -> str:
+            """
+            Serializes data as JSON to a string.
+
+            Args:
+                obj: The data to serialize.
+                **kwargs: json.dumps options; any forces the json module.
+
+            Returns:
+                str: The JSON text.
+            """
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return orjson.dumps(obj, default=self.default,
+                                option=ORJSON_OPTIONS).decode()
+
+        def loads(self, s, **kwargs):
+            """
+            Deserializes JSON text or bytes.
+
+            Args:
+                s: The JSON document.
+                **kwargs: json.loads options; any forces the json module.
+
+            Returns:
+                The decoded data.
+            """
+            if kwargs:
+                return super().loads(s, **kwargs)
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            """
+            Serializes the arguments to a JSON response, like jsonify.
+
+            Returns:
+                Response: An application/json response.
+            """
+            if (self.compact is None and self._app.debug) \
+                    or self.compact is False:
+                return super().response(*args, **kwargs)
+            obj = self._prepare_response_obj(args, kwargs)
+            body = orjson.dumps(obj, default=self.default,
+                                option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+            return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def install(app) -> bool:
+    """
+    Makes the application serialize with orjson when it can.
+
+    Args:
+        app: The Flask application.
+
+    Returns:
+        bool: True if orjson is now used.
+    """
+    if not USE_ORJSON or DefaultJSONProvider is None:
+        return False
+    app.json = ORJSONProvider(app)
+    return True
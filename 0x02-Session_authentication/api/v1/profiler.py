@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Profiler module for the API.
+This module turns cProfile on for a limited number of seconds or requests,
+optionally scoped to a route prefix, and dumps the aggregated statistics in
+the pstats format (readable by snakeviz, gprof2dot or flameprof).
+
+Only one request is profiled at a time; concurrent requests are served
+unprofiled. While no capture is running, the request hooks only read a flag.
+"""
+
+import cProfile
+import os
+import pstats
+import signal
+from datetime import datetime
+from threading import Lock, RLock
+from time import monotonic
+from typing import Optional
+from flask import g, request
+
+DEFAULT_SECONDS = 30
+
+
+class RouteProfiler:
+    """ Samples requests with cProfile during a capture window. """
+
+    def __init__(self, output_dir: str = "."):
+        """
+        Initializes an idle profiler.
+
+        Args:
+            output_dir (str): The directory where the captures are dumped.
+        """
+        self.output_dir = output_dir
+        self.installed = False
+        self.active = False
+        self.route = None
+        self.deadline = None
+        self.remaining = None
+        self.last_dump = None
+        self._stats = None
+        self._lock = RLock()
+        self._sampling = Lock()
+
+    def start(self, route: str = None, seconds: float = None,
+              requests: int = None) -> dict:
+        """
+        Starts a capture. Without a limit, it lasts DEFAULT_SECONDS.
+
+        Args:
+            route (str): Only profile paths starting with this prefix.
+            seconds (float): The duration of the capture.
+            requests (int): The number of requests to profile.
+
+        Returns:
+            dict: The status of the profiler.
+        """
+        if seconds is None and requests is None:
+            seconds = DEFAULT_SECONDS
+        with self._lock:
+            self._stats = None
+            self.route = route
+            self.deadline = None if seconds is None \
+                else monotonic() + float(seconds)
+            self.remaining = None if requests is None else int(requests)
+            self.active = True
+        return self.status()
+
+    def stop(self) -> Optional[str]:
+        """
+        Stops the capture and dumps what has been collected.
+
+        Returns:
+            str: The path of the dump, or None if nothing was profiled.
+        """
+        with self._lock:
+            if not self.active:
+                return None
+            self.active = False
+            stats, self._stats = self._stats, None
+            if stats is None:
+                return None
+            slug = (self.route or "all").strip("/").replace("/", "_")
+            file_name = "profile-{}-{}.prof".format(
+                slug or "root", datetime.utcnow().strftime("%Y%m%dT%H%M%S"))
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.last_dump = os.path.join(self.output_dir, file_name)
+            stats.dump_stats(self.last_dump)
+            return self.last_dump
+
+    def status(self) -> dict:
+        """
+        Returns the status of the profiler.
+        """
+        seconds_left = None
+        if self.active and self.deadline is not None:
+            seconds_left = round(max(0.0, self.deadline - monotonic()), 3)
+        return {
+            "active": self.active,
+            "route": self.route,
+            "seconds_left": seconds_left,
+            "requests_left": self.remaining,
+            "last_dump": self.last_dump,
+        }
+
+    def wants(self, path: str) -> bool:
+        """
+        Checks if a request path should be profiled.
+
+        Args:
+            path (str): The request path.
+
+        Returns:
+            bool: True if the request should be profiled.
+        """
+        if not self.active:
+            return False
+        if self.deadline is not None and monotonic() >= self.deadline:
+            self.stop()
+            return False
+        return self.route is None or path.startswith(self.route)
+
+    def begin(self) -> Optional[cProfile.Profile]:
+        """
+        Starts profiling the current request, unless another one is.
+
+        Returns:
+            cProfile.Profile: The running profile, or None.
+        """
+        if not self._sampling.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool holds the interpreter hooks
+            self._sampling.release()
+            return None
+        return profile
+
+    def end(self, profile: cProfile.Profile) -> None:
+        """
+        Stops profiling a request and adds it to the capture.
+
+        Args:
+            profile (cProfile.Profile): The profile returned by `begin`.
+        """
+        profile.disable()
+        self._sampling.release()
+        done = False
+        with self._lock:
+            if not self.active:
+                return
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            if self.remaining is not None:
+                self.remaining -= 1
+                done = self.remaining <= 0
+        if done:
+            self.stop()
+
+
+PROFILER = RouteProfiler(os.getenv("PROFILER_DIR", "."))
+
+
+def before_request() -> None:
+    """ Starts profiling the request if a capture wants it. """
+    if PROFILER.active and PROFILER.wants(request.path) \
+            and not request.path.startswith('/api/v1/profiler'):
+        g._profile = PROFILER.begin()
+
+
+def teardown_request(error=None) -> None:
+    """ Adds the profile of the request to the running capture. """
+    profile = g.pop('_profile', None)
+    if profile is not None:
+        PROFILER.end(profile)
+
+
+def _on_signal(signum, frame) -> None:
+    """ Toggles a capture of every route on SIGUSR1. """
+    if PROFILER.active:
+        PROFILER.stop()
+    else:
+        PROFILER.start(seconds=float(os.getenv("PROFILER_SECONDS",
+                                               DEFAULT_SECONDS)))
+
+
+def install(app) -> None:
+    """
+    Makes the profiler available on an application.
+
+    Args:
+        app: The Flask application.
+    """
+    # Run first, so the capture covers the authentication filter
+    app.before_request_funcs.setdefault(None, []).insert(0, before_request)
+    app.teardown_request(teardown_request)
+    if hasattr(signal, "SIGUSR1"):
+        try:
+            signal.signal(signal.SIGUSR1, _on_signal)
+        except ValueError:
+            # Not in the main thread (e.g. some WSGI servers)
+            pass
+    PROFILER.installed = True
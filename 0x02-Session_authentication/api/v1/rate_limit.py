@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Rate limiting module for the API.
+This module throttles authentication attempts with token buckets keyed by
+client IP and by (email, client IP). Every attempt reads its buckets before
+any user lookup or password hashing happens, without writing; only a failed
+attempt takes a token, so successful requests cost no write.
+
+The buckets live in a backend: `MemoryBackend` keeps them in a bounded LRU
+table of the worker, `SQLiteBackend` shares them between the workers of a
+host through a SQLite file.
+"""
+
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional
+
+LOGIN_PATH = '/api/v1/auth_session/login'
+
+
+class RateLimitBackend(ABC):
+    """ Storage of the token buckets. """
+
+    @abstractmethod
+    def peek(self, key: str, rate: float, capacity: int) -> Optional[float]:
+        """
+        Checks the bucket of a key without taking a token.
+
+        Args:
+            key (str): The bucket key.
+            rate (float): The refill rate, in tokens per second.
+            capacity (int): The size of the bucket.
+
+        Returns:
+            float: None if a token is available, otherwise the number of
+            seconds until one is.
+        """
+
+    @abstractmethod
+    def take(self, key: str, rate: float, capacity: int) -> Optional[float]:
+        """
+        Takes a token from the bucket of a key.
+
+        Args:
+            key (str): The bucket key.
+            rate (float): The refill rate, in tokens per second.
+            capacity (int): The size of the bucket.
+
+        Returns:
+            float: None if a token was taken, otherwise the number of
+            seconds until one is available.
+        """
+
+
+class MemoryBackend(RateLimitBackend):
+    """ Per-worker buckets in a bounded LRU table. """
+
+    def __init__(self, max_keys: int = 100000):
+        """
+        Initializes an empty table.
+
+        Args:
+            max_keys (int): The number of buckets kept; the least recently
+            used bucket is forgotten (i.e. refilled) beyond it.
+        """
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, key: str, rate: float, capacity: int) -> Optional[float]:
+        """ Checks the bucket of a key without taking a token. """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        return (1 - tokens) / rate if tokens < 1 else None
+
+    def take(self, key: str, rate: float, capacity: int) -> Optional[float]:
+        """ Takes a token from the bucket of a key. """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            retry_after = None
+            if tokens < 1:
+                retry_after = (1 - tokens) / rate
+            else:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+
+class SQLiteBackend(RateLimitBackend):
+    """ Buckets shared by the workers of a host in a SQLite file. """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str):
+        """
+        Initializes the backend and its table.
+
+        Args:
+            path (str): The path of the SQLite file.
+        """
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated REAL NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Returns the connection of the current thread. """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def peek(self, key: str, rate: float, capacity: int) -> Optional[float]:
+        """ Checks the bucket of a key with a read, no transaction. """
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT tokens, updated FROM rate_limit_buckets "
+            "WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        tokens = min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+        return (1 - tokens) / rate if tokens < 1 else None
+
+    def take(self, key: str, rate: float, capacity: int) -> Optional[float]:
+        """ Takes a token from the bucket of a key. """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_limit_buckets "
+                "WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row is not None else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            retry_after = None
+            if tokens < 1:
+                retry_after = (1 - tokens) / rate
+            else:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets "
+                "(key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now))
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                # A bucket idle long enough to refill is the same as none
+                conn.execute(
+                    "DELETE FROM rate_limit_buckets WHERE updated < ?",
+                    (now - capacity / rate,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+class RateLimiter:
+    """ Token-bucket throttle of the authentication attempts. """
+
+    def __init__(self, backend: RateLimitBackend, per_minute: float = 10,
+                 burst: int = 10):
+        """
+        Initializes the throttle.
+
+        Args:
+            backend (RateLimitBackend): The storage of the buckets.
+            per_minute (float): The sustained number of failed attempts.
+            burst (int): The number of failed attempts allowed at once.
+        """
+        self.backend = backend
+        self.rate = per_minute / 60.0
+        self.burst = burst
+
+    def check(self, keys: List[str]) -> Optional[float]:
+        """
+        Checks whether an attempt may proceed, without writing.
+
+        Args:
+            keys (List[str]): The keys of the attempt.
+
+        Returns:
+            float: None if the attempt may proceed, otherwise the number of
+            seconds to wait.
+        """
+        waits = [self.backend.peek(key, self.rate, self.burst)
+                 for key in keys]
+        waits = [wait for wait in waits if wait is not None]
+        return max(waits) if waits else None
+
+    def charge(self, keys: List[str]) -> None:
+        """
+        Takes a token for a failed attempt from the bucket of every key.
+
+        Args:
+            keys (List[str]): The keys of the attempt.
+        """
+        for key in keys:
+            self.backend.take(key, self.rate, self.burst)
+
+
+def attempt_keys(request, auth) -> List[str]:
+    """
+    Returns the throttle keys of a request carrying credentials.
+
+    Args:
+        request: The Flask request object.
+        auth: The authentication instance of the application.
+
+    Returns:
+        List[str]: The IP key and the (email, IP) key, or an empty list
+        when the request does not try to authenticate with a password. The
+        email key includes the IP so that bad passwords sent from elsewhere
+        can't lock a user out.
+    """
+    email = None
+    if request.path.rstrip('/') == LOGIN_PATH and request.method == 'POST':
+        email = request.form.get('email') or ''
+    elif hasattr(auth, 'credentials_from_header'):
+        header = auth.authorization_header(request)
+        if header is None:
+            return []
+        email = auth.credentials_from_header(header)[0] or ''
+    else:
+        return []
+    return ['ip:{}'.format(request.remote_addr),
+            'email:{}|{}'.format(email.lower(), request.remote_addr)]
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 This module sets up the Flask Blueprint for the application views.
-It imports the necessary modules and ensures user data is loaded on startup.
+It imports the route modules; user data is loaded from file on first use
+(see Base.ensure_loaded), or ahead of time by api.v1.app.warm_up.
 """
 
 from flask import Blueprint
@@ -12,7 +13,4 @@ app_views = Blueprint("app_views", __name__, url_prefix="/api/v1")
 from api.v1.views.index import *
 from api.v1.views.users import *
 from api.v1.views.session_auth import *
-
-# Load user data from file
-User.load_from_file()
-
+from api.v1.views.profiler import *
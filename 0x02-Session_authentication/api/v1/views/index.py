@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 """ Module of Index views """
-from flask import jsonify, abort
+import hmac
+from os import getenv
+from flask import jsonify, abort, request, Response
 from api.v1.views import app_views
 
+# Days of signups reported by /stats, and how long clients may cache it
+STATS_DAYS = int(getenv("STATS_DAYS", 30))
+STATS_CACHE_TTL = int(getenv("STATS_CACHE_TTL", 10))
+
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
 def status() -> str:
     """ GET /api/v1/status
@@ -16,11 +22,47 @@ def stats() -> str:
     """ GET /api/v1/stats
     Return:
       - the number of each objects
+      - the signups of the last STATS_DAYS days, by day
+      - the session and authentication counters; active_sessions is null
+        with signed sessions, which are stateless and cannot be counted
+    All are maintained as the data changes (models.stats): no scan.
     """
+    from api.v1.app import auth
+    from models.stats import COUNTERS
     from models.user import User
+    users = User.stats(STATS_DAYS)
     stats = {}
-    stats['users'] = User.count()
-    return jsonify(stats)
+    stats['users'] = users['count']
+    stats['signups_per_day'] = users['created_per_day']
+    for name in ('active_sessions', 'sessions_created',
+                 'sessions_destroyed', 'auth_failures', 'auth_throttled'):
+        stats[name] = COUNTERS.get(name)
+    if getattr(auth, 'signer', None) is not None:
+        stats['active_sessions'] = None
+    response = jsonify(stats)
+    response.headers['Cache-Control'] = \
+        "private, max-age={}".format(STATS_CACHE_TTL)
+    return response
+
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Authenticated like the other routes, or, when METRICS_TOKEN is set,
+    by an X-Metrics-Token header matching it
+    Return:
+      - the per-phase request timings in the Prometheus text format
+      - 404 if the instrumentation is disabled (API_METRICS != 1)
+      - 403 if METRICS_TOKEN is set and the token is wrong
+    """
+    from api.v1.instrumentation import METRICS
+    if not METRICS.enabled:
+        abort(404)
+    token = getenv("METRICS_TOKEN")
+    given = request.headers.get('X-Metrics-Token', '')
+    if token and not hmac.compare_digest(given.encode(), token.encode()):
+        abort(403)
+    return Response(METRICS.render(),
+                    mimetype="text/plain; version=0.0.4")
 
 @app_views.route('/unauthorized', methods=['GET'], strict_slashes=False)
 def unauthorized() -> str:
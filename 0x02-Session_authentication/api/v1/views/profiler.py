@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Module of Profiler views.
+This module lets an administrator start, inspect and stop cProfile captures
+on a running API. Every route requires the X-Profiler-Token header to match
+the PROFILER_TOKEN environment variable.
+"""
+
+import hmac
+from os import getenv
+from flask import abort, jsonify, request
+from api.v1.views import app_views
+
+
+def check_token() -> None:
+    """
+    Aborts the request unless it carries the profiler admin token.
+    404 if the profiler is not enabled, 403 if the token is wrong.
+    """
+    from api.v1.profiler import PROFILER
+    token = getenv('PROFILER_TOKEN')
+    if not PROFILER.installed or not token:
+        abort(404)
+    given = request.headers.get('X-Profiler-Token', '')
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        abort(403)
+
+
+@app_views.route('/profiler', methods=['GET'], strict_slashes=False)
+def profiler_status() -> str:
+    """
+    GET /api/v1/profiler
+    Returns the status of the profiler.
+    """
+    from api.v1.profiler import PROFILER
+    check_token()
+    return jsonify(PROFILER.status())
+
+
+@app_views.route('/profiler', methods=['POST'], strict_slashes=False)
+def profiler_start() -> str:
+    """
+    POST /api/v1/profiler
+    Starts a capture.
+
+    JSON body:
+        - route (str): Only profile paths starting with it (optional).
+        - seconds (float): Duration of the capture (optional).
+        - requests (int): Number of requests to profile (optional).
+
+    Returns:
+        The status of the profiler.
+        400 error if the body is not a JSON object, the route is not a
+        string, or a limit is not a positive number.
+    """
+    from api.v1.profiler import PROFILER
+    check_token()
+    rj = request.get_json(silent=True)
+    if rj is None:
+        rj = {}
+    if not isinstance(rj, dict):
+        return jsonify({'error': "Wrong format"}), 400
+    route = rj.get('route')
+    seconds = rj.get('seconds')
+    requests = rj.get('requests')
+    if route is not None and not isinstance(route, str):
+        return jsonify({'error': "Wrong format"}), 400
+    if seconds is not None and (isinstance(seconds, bool) or
+                                not isinstance(seconds, (int, float)) or
+                                not 0 < seconds < float('inf')):
+        return jsonify({'error': "Wrong format"}), 400
+    if requests is not None and (isinstance(requests, bool) or
+                                 not isinstance(requests, int) or
+                                 requests <= 0):
+        return jsonify({'error': "Wrong format"}), 400
+    return jsonify(PROFILER.start(route, seconds, requests)), 201
+
+
+@app_views.route('/profiler', methods=['DELETE'], strict_slashes=False)
+def profiler_stop() -> str:
+    """
+    DELETE /api/v1/profiler
+    Stops the capture and dumps the collected statistics.
+
+    Returns:
+        The status of the profiler, `last_dump` being the pstats file.
+    """
+    from api.v1.profiler import PROFILER
+    check_token()
+    PROFILER.stop()
+    return jsonify(PROFILER.status())
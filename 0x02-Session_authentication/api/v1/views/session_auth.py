@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Module of Session authentication views.
+This module handles the login and logout routes of the session-based
+authentication system.
+"""
+
+from os import getenv
+from flask import abort, jsonify, request
+from api.v1.views import app_views
+from models.stats import COUNTERS
+from models.user import User
+
+
+@app_views.route('/auth_session/login', methods=['POST'], strict_slashes=False)
+def login() -> str:
+    """
+    POST /api/v1/auth_session/login
+    Authenticates a user and creates a new session for them.
+
+    Form body:
+        - email (str): The user's email.
+        - password (str): The user's password.
+
+    Returns:
+        A JSON representation of the User object, with the session ID
+        set in the cookie named by SESSION_NAME.
+        400 error if the email or the password is missing.
+        404 error if no user matches the email.
+        401 error if the password is wrong.
+    """
+    email = request.form.get('email')
+    if email is None or email == "":
+        return jsonify({"error": "email missing"}), 400
+    password = request.form.get('password')
+    if password is None or password == "":
+        return jsonify({"error": "password missing"}), 400
+
+    users = User.search({'email': email})
+    if not users:
+        COUNTERS.incr('auth_failures')
+        return jsonify({"error": "no user found for this email"}), 404
+    user = users[0]
+    if not user.is_valid_password(password, upgrade=True):
+        COUNTERS.incr('auth_failures')
+        return jsonify({"error": "wrong password"}), 401
+
+    from api.v1.app import auth
+    session_id = auth.create_session(user.id)
+    response = jsonify(user.to_json())
+    response.set_cookie(getenv('SESSION_NAME'), session_id)
+    return response
+
+
+@app_views.route('/auth_session/logout', methods=['DELETE'],
+                 strict_slashes=False)
+def logout() -> str:
+    """
+    DELETE /api/v1/auth_session/logout
+    Destroys the session attached to the request cookie.
+
+    Returns:
+        An empty JSON dictionary if the session has been destroyed.
+        404 error if there is no valid session to destroy.
+    """
+    from api.v1.app import auth
+    if not auth.destroy_session(request):
+        abort(404)
+    return jsonify({}), 200
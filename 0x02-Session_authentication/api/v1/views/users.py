@@ -5,10 +5,136 @@ This module handles all the routes related to user operations such as creating,
 retrieving, updating, and deleting user data.
 """
 
-from flask import abort, jsonify, request
+import copy
+import json
+from datetime import datetime, timezone
+from os import cpu_count, getenv
+from flask import abort, jsonify, request, Response
+from api.v1.compression import etag_variants
+from api.v1.json_provider import dumps
 from api.v1.views import app_views
+from models.base import VersionConflict
+from models.query import Range
 from models.user import User
 
+BULK_HASH_WORKERS = int(getenv('BULK_HASH_WORKERS', cpu_count() or 1))
+BULK_MAX_ERRORS = 100
+EXPORT_CHUNK_SIZE = 1000
+RECENT_DEFAULT_LIMIT = 20
+RECENT_MAX_LIMIT = 100
+
+def parse_utc(value: str) -> datetime:
+    """
+    Parses an ISO timestamp into a naive UTC datetime, the form in which
+    the timestamps are stored. A value with an offset is converted.
+
+    Args:
+        value (str): The ISO timestamp.
+
+    Returns:
+        datetime: The naive UTC datetime.
+
+    Raises:
+        ValueError: If the value is not an ISO timestamp.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def is_fresh(etag: str, last_modified: datetime) -> str:
+    """
+    Checks the If-None-Match and If-Modified-Since headers of the request,
+    before anything is serialized.
+
+    Args:
+        etag (str): The current ETag of the resource.
+        last_modified (datetime): Its last change, naive UTC, or None.
+
+    Returns:
+        str: The ETag of the client's copy if it is current and a 304 will
+        do, with the encoding suffix of a compressed copy; None otherwise.
+    """
+    if request.if_none_match:
+        for variant in etag_variants(etag):
+            if request.if_none_match.contains_weak(variant):
+                return variant
+        return None
+    since = request.if_modified_since
+    if since is None or last_modified is None:
+        return None
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return etag if last_modified.replace(microsecond=0) <= since else None
+
+
+def conditional(body, etag: str, last_modified: datetime,
+                status: int = 200):
+    """
+    Builds a response carrying ETag and Last-Modified, or an empty 304 if
+    the copy of a GET request is current; `body` is then not called.
+
+    Args:
+        body (Callable): Returns the JSON-serializable body.
+        etag (str): The ETag of the resource.
+        last_modified (datetime): Its last change, naive UTC, or None.
+        status (int): The HTTP status code of a full response.
+
+    Returns:
+        The response object.
+    """
+    fresh = None
+    if status == 200 and request.method in ('GET', 'HEAD'):
+        fresh = is_fresh(etag, last_modified)
+    if fresh is not None:
+        # The 304 carries the ETag of the copy the client holds
+        response = Response(status=304)
+        etag = fresh
+    else:
+        response = jsonify(body())
+        response.status_code = status
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def user_response(user: User, status: int = 200):
+    """
+    Builds the JSON response of a single user, with its version as ETag
+    and its updated_at as Last-Modified.
+
+    Args:
+        user (User): The user to return.
+        status (int): The HTTP status code.
+
+    Returns:
+        The response object, 304 if the client's copy is current.
+    """
+    return conditional(user.to_json, str(user._version), user.updated_at,
+                       status)
+
+
+def expected_version(user: User) -> int:
+    """
+    Checks the If-Match header of the request against a user.
+
+    Args:
+        user (User): The stored user.
+
+    Returns:
+        int: The version the request expects, None without If-Match.
+        Aborts with 412 if the header matches another version.
+    """
+    if not request.if_match:
+        return None
+    if not any(request.if_match.contains(etag)
+               for etag in etag_variants(str(user._version))) \
+            and not request.if_match.star_tag:
+        abort(412)
+    return user._version
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """
@@ -16,10 +142,12 @@ def view_all_users() -> str:
     Retrieves the list of all User objects.
 
     Returns:
-        A JSON list of all User objects.
+        A JSON list of all User objects, with the store version as ETag;
+        304 if the client's copy is current.
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    etag, last_modified = User.store_version()
+    return conditional(lambda: [user.to_json() for user in User.all()],
+                       etag, last_modified)
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
 def view_one_user(user_id: str = None) -> str:
@@ -39,12 +167,12 @@ def view_one_user(user_id: str = None) -> str:
     if user_id == "me":
         if request.current_user is None:
             abort(401, description="Unauthorized")  # Change to 401
-        return jsonify(request.current_user.to_json())
+        return user_response(request.current_user)
 
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    return user_response(user)
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
 def delete_user(user_id: str = None) -> str:
@@ -64,7 +192,10 @@ def delete_user(user_id: str = None) -> str:
     user = User.get(user_id)
     if user is None:
         abort(404)
-    user.remove()
+    try:
+        user.remove(expected_version=expected_version(user))
+    except VersionConflict:
+        abort(412)
     return jsonify({}), 200
 
 @app_views.route('/users', methods=['POST'], strict_slashes=False)
@@ -100,10 +231,207 @@ def create_user() -> str:
         user.first_name = rj.get("first_name")
         user.last_name = rj.get("last_name")
         user.save()
-        return jsonify(user.to_json()), 201
+        return user_response(user, 201)
     except Exception as e:
         return jsonify({'error': "Can't create User: {}".format(e)}), 400
 
+def read_bulk_payload() -> list:
+    """
+    Reads the records of a bulk request body: a JSON array, or one JSON
+    object per line when the Content-Type is application/x-ndjson.
+
+    Returns:
+        list: The decoded records, or None if the body is malformed.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        records = []
+        try:
+            for line in request.stream:
+                if line.strip():
+                    records.append(json.loads(line))
+        except ValueError:
+            return None
+        return records
+    rj = request.get_json(silent=True)
+    return rj if isinstance(rj, list) else None
+
+
+def validate_bulk_record(record) -> str:
+    """
+    Validates one record of a bulk import.
+
+    Returns:
+        str: The error message, or None if the record is valid.
+    """
+    if not isinstance(record, dict):
+        return "Wrong format"
+    for field in ('email', 'password'):
+        value = record.get(field)
+        if value is None or value == "":
+            return "{} missing".format(field)
+        if not isinstance(value, str):
+            return "{} must be a string".format(field)
+    return None
+
+
+def hash_passwords(hasher, passwords: list) -> list:
+    """
+    Hashes a chunk of passwords, in one worker of the bulk import pool.
+    """
+    return [hasher.encode(pwd) for pwd in passwords]
+
+
+def hash_bulk_passwords(passwords: list) -> list:
+    """
+    Hashes the passwords of a bulk import with the import hasher
+    (BULK_PASSWORD_HASHER): by default a fast salted hash, re-hashed by the
+    default hasher at the first login. Hashers that release the GIL
+    (scrypt, bcrypt) run on BULK_HASH_WORKERS threads; the others would
+    only contend for it and run inline.
+
+    Args:
+        passwords (list): The passwords.
+
+    Returns:
+        list: Their hashes, in the same order.
+
+    Raises:
+        ValueError: If a password can't be hashed or no hasher is usable.
+    """
+    from functools import partial
+    from models.hashers import import_hasher
+    hasher = import_hasher()
+    if not hasher.releases_gil or BULK_HASH_WORKERS <= 1:
+        return hash_passwords(hasher, passwords)
+    from concurrent.futures import ThreadPoolExecutor
+    size = max(1, -(-len(passwords) // (BULK_HASH_WORKERS * 4)))
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    hashes = []
+    with ThreadPoolExecutor(max_workers=BULK_HASH_WORKERS) as executor:
+        for hashed in executor.map(partial(hash_passwords, hasher), chunks):
+            hashes.extend(hashed)
+    return hashes
+
+
+@app_views.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def create_users_bulk() -> str:
+    """
+    POST /api/v1/users/bulk
+    Creates many User objects with a single persistence flush.
+
+    Body: a JSON array, or NDJSON (Content-Type: application/x-ndjson),
+    of objects with the same fields as POST /api/v1/users.
+
+    Returns:
+        The number of created users, with a 201 status.
+        400 error with the first invalid records if any record is invalid,
+        or if a password can't be encoded; nothing is created in that case.
+        503 error if the passwords can't be hashed.
+    """
+    records = read_bulk_payload()
+    if records is None:
+        return jsonify({'error': "Wrong format"}), 400
+    errors = []
+    for index, record in enumerate(records):
+        error = validate_bulk_record(record)
+        if error is not None:
+            errors.append({'index': index, 'error': error})
+            if len(errors) >= BULK_MAX_ERRORS:
+                break
+    if errors:
+        return jsonify({'error': "Invalid records", 'records': errors}), 400
+
+    try:
+        hashes = hash_bulk_passwords([record['password']
+                                      for record in records])
+    except UnicodeError:
+        return jsonify({'error': "Invalid password encoding"}), 400
+    except (ValueError, MemoryError, OSError) as e:
+        return jsonify({'error': "Can't hash passwords: {}".format(e)}), 503
+    users = []
+    for record, hashed in zip(records, hashes):
+        user = User()
+        user.email = record['email']
+        user._password = hashed
+        user.first_name = record.get('first_name')
+        user.last_name = record.get('last_name')
+        users.append(user)
+    try:
+        User.save_many(users)
+    except Exception as e:
+        return jsonify({'error': "Can't create Users: {}".format(e)}), 400
+    return jsonify({'created': len(users)}), 201
+
+
+@app_views.route('/users/export', methods=['GET'], strict_slashes=False)
+def export_users() -> str:
+    """
+    GET /api/v1/users/export
+    Streams all User objects as NDJSON, one JSON object per line.
+
+    Returns:
+        An application/x-ndjson response.
+    """
+    users = User.all()
+
+    def generate():
+        for start in range(0, len(users), EXPORT_CHUNK_SIZE):
+            chunk = users[start:start + EXPORT_CHUNK_SIZE]
+            yield "".join(dumps(user.to_json()) + "\n"
+                          for user in chunk)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app_views.route('/users/recent', methods=['GET'], strict_slashes=False)
+def recent_users() -> str:
+    """
+    GET /api/v1/users/recent
+    Lists the most recently created (or updated) users, newest first, one
+    page at a time from the sorted timestamp index.
+
+    Query parameters:
+        - field (str): created_at (default) or updated_at.
+        - since (str): ISO timestamp, UTC unless it has an offset; only
+          users at or after it (optional).
+        - limit (int): The page size, at most RECENT_MAX_LIMIT.
+        - cursor (str): The `next` value of the previous page (optional).
+
+    Returns:
+        A JSON object with the `users` of the page and the `next` cursor,
+        null on the last page.
+        400 error if a parameter is invalid.
+    """
+    field = request.args.get('field', 'created_at')
+    if field not in ('created_at', 'updated_at'):
+        return jsonify({'error': "field must be created_at or updated_at"}), 400
+    try:
+        limit = int(request.args.get('limit', RECENT_DEFAULT_LIMIT))
+        since = request.args.get('since')
+        since = parse_utc(since) if since else None
+        after = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            timestamp, user_id = cursor.split('|', 1)
+            after = (parse_utc(timestamp), user_id)
+    except ValueError:
+        return jsonify({'error': "Wrong format"}), 400
+    if not 0 < limit <= RECENT_MAX_LIMIT:
+        return jsonify({'error': "limit must be between 1 and {}".format(
+            RECENT_MAX_LIMIT)}), 400
+
+    predicates = [Range(field, low=since)] if since else []
+    users = User.query(*predicates, order_by='-' + field, limit=limit,
+                       after=after)
+    next_cursor = None
+    if len(users) == limit:
+        last = users[-1]
+        next_cursor = "{}|{}".format(getattr(last, field).isoformat(),
+                                     last.id)
+    return jsonify({'users': [user.to_json() for user in users],
+                    'next': next_cursor})
+
+
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
 def update_user(user_id: str = None) -> str:
     """
@@ -117,25 +445,42 @@ def update_user(user_id: str = None) -> str:
         - first_name (str): The user's first name (optional).
         - last_name (str): The user's last name (optional).
 
+    Headers:
+        - If-Match: The ETag of the version the update is based on
+          (optional).
+
     Returns:
-        A JSON representation of the updated User object.
+        A JSON representation of the updated User object, with its ETag.
         404 error if the User ID does not exist or is invalid.
         400 error if the update fails due to invalid data.
+        412 error if the user is no longer at the If-Match version.
     """
     if user_id is None:
         abort(404)
     user = User.get(user_id)
     if user is None:
         abort(404)
+    version = expected_version(user)
     try:
         rj = request.get_json()
     except Exception:
         rj = None
     if rj is None:
         return jsonify({'error': "Wrong format"}), 400
-    if rj.get('first_name') is not None:
-        user.first_name = rj.get('first_name')
-    if rj.get('last_name') is not None:
-        user.last_name = rj.get('last_name')
-    user.save()
-    return jsonify(user.to_json()), 200
+    while True:
+        # Update a copy, swapped in only if no other update got there first
+        updated = copy.copy(user)
+        if rj.get('first_name') is not None:
+            updated.first_name = rj.get('first_name')
+        if rj.get('last_name') is not None:
+            updated.last_name = rj.get('last_name')
+        try:
+            updated.save(expected_version=user._version)
+            return user_response(updated)
+        except VersionConflict:
+            if version is not None:
+                abort(412)
+        # Without If-Match, apply the changes to the newer version
+        user = User.get(user_id)
+        if user is None:
+            abort(404)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Load-testing harness for the Basic/Session authentication APIs.
+
+The harness imports `api.v1.app` from a project directory, seeds a synthetic
+user population and drives the main endpoints through Flask's test client
+from a pool of worker threads. For each endpoint it reports the throughput
+(req/s) and the p50/p99 latencies, and it can write the results to a JSON
+baseline or compare a run against an existing one.
+
+Usage (from the project directory):
+    AUTH_TYPE=session_auth python3 benchmarks/api_load.py \\
+        --users 1000 --concurrency 8 --requests 2000 --output baseline.json
+    AUTH_TYPE=session_auth python3 benchmarks/api_load.py \\
+        --compare baseline.json --tolerance 0.2
+
+The same script drives `0x01-Basic_authentication` with
+`--app-dir ../0x01-Basic_authentication`. Endpoints a project does not serve
+are skipped.
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+ENDPOINTS = ['status', 'users', 'users_me', 'login', 'logout']
+PASSWORD = "benchPwd!"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """
+    Returns the nearest-rank percentile of an already sorted list.
+
+    Args:
+        sorted_values (List[float]): The sorted samples.
+        pct (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile value, or 0.0 for an empty list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1,
+                      int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def load_app(app_dir: str, auth_type: str):
+    """
+    Imports the Flask application of a project directory.
+
+    The working directory is moved to a temporary directory first, so the
+    `.db_*.json` files written by the models never touch the project data.
+
+    Args:
+        app_dir (str): The project directory containing `api/` and `models/`.
+        auth_type (str): The value of AUTH_TYPE for the application.
+
+    Returns:
+        The Flask application object.
+    """
+    sys.path.insert(0, os.path.abspath(app_dir))
+    os.environ['AUTH_TYPE'] = auth_type
+    os.environ.setdefault('SESSION_NAME', '_my_session_id')
+    os.chdir(tempfile.mkdtemp(prefix="api_load_"))
+    from api.v1.app import app
+    return app
+
+
+def seed_users(count: int) -> List:
+    """
+    Creates a synthetic user population with a single persistence flush.
+
+    Args:
+        count (int): The number of users to create.
+
+    Returns:
+        List[User]: The created users.
+    """
+    from models.base import DATA
+    from models.user import User
+
+    User.load_from_file()
+    # Hashing is deliberately slow: hash once and share it
+    hashed = User.hash_password(PASSWORD)
+    users = []
+    for i in range(count):
+        user = User()
+        user.email = "bench{}@example.com".format(i)
+        user._password = hashed
+        user.first_name = "Bench"
+        user.last_name = str(i)
+        DATA[User.__name__][user.id] = user
+        users.append(user)
+    User.save_to_file()
+    return users
+
+
+class Scenario:
+    """
+    Builds the requests sent to each endpoint.
+    """
+
+    def __init__(self, app, users: List):
+        """
+        Initializes a scenario for an application and a user population.
+
+        Args:
+            app: The Flask application object.
+            users (List[User]): The synthetic users.
+        """
+        import api.v1.app as app_module
+        self.app = app
+        self.users = users
+        self.auth = getattr(app_module, 'auth', None)
+        self.session_name = os.getenv('SESSION_NAME')
+
+    def _credentials(self, i: int) -> Dict[str, str]:
+        """
+        Returns the headers authenticating the i-th synthetic user.
+        """
+        user = self.users[i % len(self.users)]
+        if self.auth is not None and hasattr(self.auth, 'create_session') \
+                and os.getenv('AUTH_TYPE', '').startswith('session'):
+            session_id = self.auth.create_session(user.id)
+            return {'Cookie': '{}={}'.format(self.session_name, session_id)}
+        token = "{}:{}".format(user.email, PASSWORD).encode('utf-8')
+        return {'Authorization': 'Basic ' +
+                base64.b64encode(token).decode('ascii')}
+
+    def supports(self, endpoint: str) -> bool:
+        """
+        Checks that the configured authentication can drive an endpoint.
+        """
+        if endpoint in ('login', 'logout'):
+            return hasattr(self.auth, 'create_session')
+        return True
+
+    def build(self, endpoint: str, count: int) -> List[Tuple]:
+        """
+        Prepares the requests of an endpoint, outside of the timed section.
+
+        Args:
+            endpoint (str): One of ENDPOINTS.
+            count (int): The number of requests to prepare.
+
+        Returns:
+            List[Tuple]: (method, path, headers, form) tuples.
+        """
+        requests = []
+        for i in range(count):
+            if endpoint == 'status':
+                requests.append(('GET', '/api/v1/status', {}, None))
+            elif endpoint == 'users':
+                requests.append(('GET', '/api/v1/users',
+                                 self._credentials(i), None))
+            elif endpoint == 'users_me':
+                requests.append(('GET', '/api/v1/users/me',
+                                 self._credentials(i), None))
+            elif endpoint == 'login':
+                user = self.users[i % len(self.users)]
+                requests.append(('POST', '/api/v1/auth_session/login', {},
+                                 {'email': user.email,
+                                  'password': PASSWORD}))
+            elif endpoint == 'logout':
+                requests.append(('DELETE', '/api/v1/auth_session/logout',
+                                 self._credentials(i), None))
+        return requests
+
+
+def run_endpoint(app, requests: List[Tuple], concurrency: int) -> Dict:
+    """
+    Sends prepared requests from a pool of threads and measures them.
+
+    Args:
+        app: The Flask application object.
+        requests (List[Tuple]): The prepared requests.
+        concurrency (int): The number of worker threads.
+
+    Returns:
+        Dict: The requests, errors, rps, p50_ms and p99_ms of the run.
+    """
+    chunks = [requests[i::concurrency] for i in range(concurrency)]
+
+    def worker(chunk: List[Tuple]) -> Tuple[List[float], int]:
+        client = app.test_client(use_cookies=False)
+        latencies = []
+        errors = 0
+        for method, path, headers, form in chunk:
+            start = time.perf_counter()
+            response = client.open(path, method=method, headers=headers,
+                                   data=form)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, chunks))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(lat for chunk, _ in results for lat in chunk)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def is_served(app, request: Tuple) -> bool:
+    """
+    Checks that the application serves an endpoint at all.
+    """
+    method, path, headers, form = request
+    client = app.test_client(use_cookies=False)
+    response = client.open(path, method=method, headers=headers, data=form)
+    return response.status_code != 404
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compares a run against a baseline.
+
+    Args:
+        results (Dict): The endpoints section of the current run.
+        baseline (Dict): The endpoints section of the baseline.
+        tolerance (float): The accepted relative degradation (0.2 = 20%).
+
+    Returns:
+        List[str]: A description of every regression found.
+    """
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append("{}: {} req/s < baseline {} req/s".format(
+                name, current['rps'], base['rps']))
+        if current['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append("{}: p99 {} ms > baseline {} ms".format(
+                name, current['p99_ms'], base['p99_ms']))
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Entry point of the harness.
+
+    Returns:
+        int: The process exit code, 1 when a regression is detected.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--app-dir', default=os.getcwd(),
+                        help="project directory (default: cwd)")
+    parser.add_argument('--auth-type',
+                        default=os.getenv('AUTH_TYPE', 'session_auth'))
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000,
+                        help="requests per endpoint")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--output', help="write the results to a JSON file")
+    parser.add_argument('--compare', help="baseline JSON file to compare to")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    output = args.output and os.path.abspath(args.output)
+    baseline_path = args.compare and os.path.abspath(args.compare)
+
+    app = load_app(args.app_dir, args.auth_type)
+    users = seed_users(args.users)
+    scenario = Scenario(app, users)
+
+    results = {}
+    for endpoint in args.endpoints.split(','):
+        if not scenario.supports(endpoint) or \
+                not is_served(app, scenario.build(endpoint, 1)[0]):
+            print("{:<10} skipped (not served)".format(endpoint))
+            continue
+        results[endpoint] = run_endpoint(
+            app, scenario.build(endpoint, args.requests), args.concurrency)
+        print("{:<10} {rps:>10.1f} req/s  p50 {p50_ms:>8.3f} ms  "
+              "p99 {p99_ms:>8.3f} ms  errors {errors}".format(
+                  endpoint, **results[endpoint]))
+
+    report = {
+        'meta': {
+            'app_dir': os.path.basename(os.path.abspath(args.app_dir)),
+            'auth_type': args.auth_type,
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'python': platform.python_version(),
+        },
+        'endpoints': results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline_path:
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['endpoints'], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Serialization time and bytes on the wire of GET /api/v1/users bodies.
+
+Builds user listings of 1k to 100k synthetic users and, for each size,
+times the stdlib encoder as Flask's default provider runs it and orjson
+as ORJSONProvider runs it, then the gzip (and brotli, when installed)
+compression of the body by the response compressor.
+
+Usage (from the project directory):
+    python3 benchmarks/json_bench.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def best_of(fn: Callable, repeat: int) -> float:
+    """
+    Returns the best duration of fn() over `repeat` runs, in milliseconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(argv: List[str] = None) -> None:
+    """ Entry point of the benchmark. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix="json_bench_"))
+    from api.v1 import json_provider
+    from api.v1.compression import Compressor, brotli
+    # ORJSON_OPTIONS is only defined when orjson is installed
+    orjson = json_provider.orjson
+    options = getattr(json_provider, 'ORJSON_OPTIONS', None)
+    from models.user import User
+
+    compressor = Compressor()
+    print("{:>7} {:>10} {:>12} {:>12} {:>11} {:>11} {:>11}".format(
+        "users", "bytes", "stdlib ms", "orjson ms", "gzip ms", "gzip bytes",
+        "br bytes"))
+    for size in args.sizes:
+        users = [User(email="bench{}@example.com".format(i),
+                      first_name="Bench", last_name=str(i),
+                      _password="0" * 64).to_json() for i in range(size)]
+        body = (json.dumps(users, sort_keys=True,
+                           separators=(",", ":")) + "\n").encode()
+        stdlib = best_of(lambda: json.dumps(users, sort_keys=True,
+                                            separators=(",", ":")),
+                         args.repeat)
+        fast = best_of(lambda: orjson.dumps(users, option=options),
+                       args.repeat) if orjson is not None else float('nan')
+        gzip_ms = best_of(lambda: compressor.compress(body, 'gzip'),
+                          args.repeat)
+        gzip_bytes = len(compressor.compress(body, 'gzip'))
+        br_bytes = len(compressor.compress(body, 'br')) \
+            if brotli is not None else float('nan')
+        print("{:>7} {:>10} {:>12.1f} {:>12.1f} {:>11.1f} {:>11} {:>11}".format(
+            size, len(body), stdlib, fast, gzip_ms, gzip_bytes, br_bytes))
+
+
+if __name__ == "__main__":
+    main()
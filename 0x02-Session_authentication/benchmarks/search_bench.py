@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of Base.search and Base.query on a synthetic population.
+
+Times an email lookup (served by the hash index of User.email), a prefix
+search with a limit, a created_at range and a newest-N query (served by
+the sorted timestamp index), and compares the email lookup with a plain
+scan of DATA like the one search used to do.
+
+Usage (from the project directory):
+    python3 benchmarks/search_bench.py --users 100000 --repeat 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def per_call(fn: Callable, repeat: int) -> float:
+    """
+    Returns the mean duration of fn() in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main(argv: List[str] = None) -> None:
+    """ Entry point of the benchmark. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix="search_bench_"))
+    from models.base import DATA
+    from models.query import Eq, Prefix, Range
+    from models.user import User
+
+    start = datetime(2020, 1, 1)
+    DATA.setdefault(User.__name__, {})
+    for i in range(args.users):
+        user = User(email="bench{}@example.com".format(i),
+                    first_name="Bench", last_name=str(i % 100))
+        user.created_at = user.updated_at = start + timedelta(minutes=i)
+        DATA[User.__name__][user.id] = user
+    email = "bench{}@example.com".format(args.users // 2)
+    week = Range('created_at', start + timedelta(days=30),
+                 start + timedelta(days=37))
+
+    def scan():
+        return [u for u in DATA[User.__name__].values()
+                if getattr(u, 'email') == email]
+
+    cases = [
+        ("scan email", scan),
+        ("search email", lambda: User.search({'email': email})),
+        ("query email + last_name",
+         lambda: User.query(Eq('email', email), Eq('last_name', '0'))),
+        ("query prefix, limit 10",
+         lambda: User.query(Prefix('email', 'bench4'), order_by='email',
+                            limit=10)),
+        ("query created_at week", lambda: User.query(week)),
+        ("query newest 10",
+         lambda: User.query(order_by='-created_at', limit=10)),
+    ]
+    User.indexes()
+    print("{} users".format(args.users))
+    for name, fn in cases:
+        print("{:<26} {:>12.1f} us".format(name, per_call(fn, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
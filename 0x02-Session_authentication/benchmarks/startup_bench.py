@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark of the API worker.
+
+Imports api.v1.app in fresh interpreters run with `python -X importtime`,
+next to a synthetic `.db_User.json`, and reports the import time of the app,
+the time to answer a first request that does not touch the users
+(`/api/v1/status`) and one that does (`/api/v1/stats`), and the project
+modules that are slowest to import.
+
+Usage (from the project directory):
+    python3 benchmarks/startup_bench.py --users 10000 --repeat 5
+    python3 benchmarks/startup_bench.py --budget-ms 400
+
+`--budget-ms` exits with status 1 when the median time to answer
+`/api/v1/status` exceeds the budget.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import uuid
+from typing import Dict, List, Tuple
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_PACKAGES = ('api', 'models')
+
+# Run in the child interpreter; prints its timings as JSON on stdout
+CHILD = """
+import json, time
+start = time.perf_counter()
+from api.v1.app import app
+imported = time.perf_counter()
+client = app.test_client()
+client.get('/api/v1/status')
+status = time.perf_counter()
+client.get('/api/v1/stats')
+stats = time.perf_counter()
+print(json.dumps({'import': imported - start, 'status': status - start,
+                  'stats': stats - start}))
+"""
+
+
+def seed_file(directory: str, count: int) -> None:
+    """
+    Writes a `.db_User.json` of `count` synthetic users.
+
+    Args:
+        directory (str): Where to write the file.
+        count (int): The number of users.
+    """
+    users = {}
+    for i in range(count):
+        user_id = str(uuid.uuid4())
+        users[user_id] = {
+            'id': user_id, '_version': 1,
+            'email': "bench{}@example.com".format(i),
+            '_password': "0" * 64, 'first_name': "Bench",
+            'last_name': str(i),
+            'created_at': "2020-01-01T00:00:00",
+            'updated_at': "2020-01-01T00:00:00",
+        }
+    with open(os.path.join(directory, ".db_User.json"), 'w') as f:
+        json.dump(users, f)
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parses the output of `-X importtime`.
+
+    Args:
+        stderr (str): The standard error of the child.
+
+    Returns:
+        Dict[str, Tuple[int, int]]: The self and cumulative import times,
+        in microseconds, of each imported module.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # Header line
+        modules[fields[2].strip()] = (own, cumulative)
+    return modules
+
+
+def run_once(directory: str, env: dict) -> Tuple[dict, dict]:
+    """
+    Starts a fresh interpreter that imports the app and answers two requests.
+
+    Returns:
+        Tuple[dict, dict]: The timings of the child in seconds, and its
+        parsed import times.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD], cwd=directory,
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    return json.loads(result.stdout), parse_importtime(result.stderr)
+
+
+def main(argv: List[str] = None) -> None:
+    """ Entry point of the benchmark. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--warm-up', action='store_true',
+                        help="load the users at import (API_WARM_UP=1)")
+    parser.add_argument('--budget-ms', type=float)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="startup_bench_")
+    seed_file(directory, args.users)
+    env = dict(os.environ, PYTHONPATH=PROJECT_DIR,
+               API_WARM_UP="1" if args.warm_up else "0")
+
+    timings = {'import': [], 'status': [], 'stats': []}
+    modules = {}
+    for _ in range(args.repeat):
+        run, modules = run_once(directory, env)
+        for name, value in run.items():
+            timings[name].append(value * 1000)
+
+    print("{} users, median of {} runs".format(args.users, args.repeat))
+    print("{:<34} {:>9}".format("milestone", "ms"))
+    for name, label in (('import', "import api.v1.app"),
+                        ('status', "first response (/status)"),
+                        ('stats', "first user read (/stats)")):
+        print("{:<34} {:>9.1f}".format(label,
+                                       statistics.median(timings[name])))
+
+    own = sorted(((value[0], name) for name, value in modules.items()
+                  if name.split(".")[0] in PROJECT_PACKAGES), reverse=True)
+    print("\n{:<34} {:>9} {:>9}".format("project module (last run)",
+                                         "self ms", "cumul ms"))
+    for _, name in own[:args.top]:
+        print("{:<34} {:>9.1f} {:>9.1f}".format(
+            name, modules[name][0] / 1000, modules[name][1] / 1000))
+
+    if args.budget_ms is not None and \
+            statistics.median(timings['status']) > args.budget_ms:
+        print("\nFirst response over the {:g} ms budget".format(
+            args.budget_ms))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
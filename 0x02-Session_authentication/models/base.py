@@ -2,36 +2,83 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
+from typing import TypeVar, List, Iterable, Tuple
+import os
 from os import path
+from threading import Lock, RLock
 import json
 import uuid
+from models.events import BUS
+from models.query import Eq, HashIndex, Predicate, SortedIndex, run_query
+from models.stats import model_stats
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+INDEX_LOCK = RLock()
+# Serializes the file writes; taken before INDEX_LOCK, never after
+FILE_LOCK = Lock()
+# Per class: number of changes since this process loaded it, and when the
+# last one happened. STORE_EPOCH tells processes (and restarts) apart.
+STORE_VERSIONS = {}
+STORE_EPOCH = uuid.uuid4().hex[:8]
+# Classes read from their file: the first use of a class loads it. A class
+# is added once its objects and indexes are in place; LOADING holds the
+# classes being read by the thread that holds INDEX_LOCK.
+LOADED = set()
+LOADING = set()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string; fromisoformat is much faster than
+    strptime, which dominated load_from_file
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class VersionConflict(Exception):
+    """ Raised by a conditional save or remove of a stale object
+    """
+
+    def __init__(self, obj_id: str, expected: int, current: int):
+        """ Initialize with the versions that did not match
+        """
+        super().__init__("{} is at version {}, not {}".format(
+            obj_id, current, expected))
+        self.id = obj_id
+        self.expected = expected
+        self.current = current
 
 
 class Base():
     """ Base class
     """
+    # Attributes with a hash index (equality) or a sorted index (ranges,
+    # prefixes and ordering), kept up to date by save() and remove()
+    indexed_attributes = ()
+    sorted_attributes = ('created_at', 'updated_at')
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
+        self.__class__.ensure_loaded()
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
+        # Number of saves: change events and conditional saves
+        self._version = kwargs.get('_version', 0)
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
@@ -57,57 +104,212 @@ class Base():
                 result[key] = value
         return result
 
+    @classmethod
+    def ensure_loaded(cls):
+        """ Load the objects from file unless it was already done
+
+        Other threads wait for a load in progress instead of reading a
+        partly filled store.
+        """
+        if cls.__name__ in LOADED:
+            return
+        with INDEX_LOCK:
+            if cls.__name__ not in LOADED and cls.__name__ not in LOADING:
+                cls.load_from_file()
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+
+        The objects are read into a new dict, published to DATA with their
+        indexes, and only then is the class marked as loaded.
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        with INDEX_LOCK:
+            objs = {}
+            LOADING.add(s_class)
+            try:
+                if path.exists(file_path):
+                    with open(file_path, 'r') as f:
+                        objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        objs[obj_id] = cls(**obj_json)
+            finally:
+                LOADING.discard(s_class)
+            DATA[s_class] = objs
+            cls.reindex()
+            model_stats(s_class).reset(objs.values())
+            cls.changed()
+            LOADED.add(s_class)
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Save all objects to file, atomically
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
-
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+        tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        with FILE_LOCK:
+            # Snapshots are taken and written in the same order, so the
+            # file always ends up with the latest one
+            with INDEX_LOCK:
+                objs_json = {}
+                for obj_id, obj in DATA[s_class].items():
+                    objs_json[obj_id] = obj.to_json(True)
+            with open(tmp_path, 'w') as f:
+                json.dump(objs_json, f)
+            # Readers see the old file or the new one, never a partial one
+            os.replace(tmp_path, file_path)
 
-    def save(self):
+    def save(self, expected_version: int = None, touch: bool = True):
         """ Save current object
+
+        With `expected_version`, the save only happens if the stored
+        object is still at that version (0 if it does not exist yet);
+        otherwise VersionConflict is raised. Saving a copy this way
+        replaces the stored object atomically: a concurrent update is
+        detected instead of overwritten.
+
+        `touch=False` persists private bookkeeping attributes of a stored
+        object (e.g. a session version): its version, `updated_at` and
+        the collection version are kept, so ETags stay valid, and no
+        change event is published.
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
+        with INDEX_LOCK:
+            current = DATA[s_class].get(self.id)
+            current_version = current._version if current is not None else 0
+            if expected_version is not None and \
+                    expected_version != current_version:
+                raise VersionConflict(self.id, expected_version,
+                                      current_version)
+            touch = touch or current is None
+            op = 'update' if current is not None else 'create'
+            # A replaced copy still has the previous state to diff against
+            previous = current.to_json() if BUS.active and \
+                current is not None and current is not self else None
+            if touch:
+                self.updated_at = datetime.utcnow()
+                self._version = max(self._version, current_version) + 1
+            DATA[s_class][self.id] = self
+            self.__class__.index(self)
+            if current is None:
+                model_stats(s_class).added(self)
+            else:
+                model_stats(s_class).replaced(current, self)
+            if touch:
+                self.__class__.changed()
         self.__class__.save_to_file()
+        if touch:
+            self.publish(op, previous)
+
+    @classmethod
+    def save_many(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save several objects with a single file write
+        """
+        s_class = cls.__name__
+        cls.ensure_loaded()
+        now = datetime.utcnow()
+        stats = model_stats(s_class)
+        ops = []
+        with INDEX_LOCK:
+            for obj in objs:
+                current = DATA[s_class].get(obj.id)
+                ops.append((obj, 'update' if current is not None
+                            else 'create'))
+                obj.updated_at = now
+                obj._version += 1
+                DATA[s_class][obj.id] = obj
+                cls.index(obj)
+                if current is None:
+                    stats.added(obj)
+                else:
+                    stats.replaced(current, obj)
+            cls.changed()
+        cls.save_to_file()
+        for obj, op in ops:
+            obj.publish(op)
 
-    def remove(self):
+    def remove(self, expected_version: int = None):
         """ Remove object
+
+        With `expected_version`, raise VersionConflict instead if the
+        stored object is at another version.
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
+        with INDEX_LOCK:
+            current = DATA[s_class].get(self.id)
+            if current is None:
+                return
+            if expected_version is not None and \
+                    expected_version != current._version:
+                raise VersionConflict(self.id, expected_version,
+                                      current._version)
             del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+            for index in INDEXES.get(s_class, {}).values():
+                index.discard(self.id)
+            model_stats(s_class).removed(current)
+            self.__class__.changed()
+        self.__class__.save_to_file()
+        self.publish('delete')
+
+    def publish(self, op: str, previous: dict = None):
+        """ Publish a change event of this object on models.events.BUS
+
+        Only the public attributes are published; `previous` are those of
+        the object before the change, if known.
+        """
+        if BUS.active:
+            state = self.to_json() if op != 'delete' else None
+            if op == 'delete' and previous is None:
+                previous = self.to_json()
+            BUS.publish(self.__class__.__name__, self.id, op, state,
+                        self._version, previous)
+
+    @classmethod
+    def changed(cls):
+        """ Record a change of the collection of the class
+        """
+        with INDEX_LOCK:
+            version, _ = STORE_VERSIONS.get(cls.__name__, (0, None))
+            STORE_VERSIONS[cls.__name__] = (version + 1, datetime.utcnow())
+
+    @classmethod
+    def store_version(cls) -> Tuple[str, datetime]:
+        """ Version of the collection of the class, and its last change
+
+        The version changes with every save or remove, so it identifies
+        the content of `all()`.
+        """
+        cls.ensure_loaded()
+        version, last_modified = STORE_VERSIONS.get(cls.__name__,
+                                                    (0, None))
+        return "{}-{}".format(STORE_EPOCH, version), last_modified
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        cls.ensure_loaded()
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
+    @classmethod
+    def stats(cls, days: int = None) -> dict:
+        """ Count and creations per day of the class, in O(1)
+
+        Maintained by save(), save_many(), remove() and load_from_file();
+        recomputed if DATA was changed directly. See models.stats.
+        """
+        s_class = cls.__name__
+        cls.ensure_loaded()
+        stats = model_stats(s_class)
+        if stats.count != len(DATA.get(s_class, {})):
+            with INDEX_LOCK:
+                stats.reset(DATA.get(s_class, {}).values())
+        return stats.snapshot(days)
+
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
         """ Return all objects
@@ -118,20 +320,72 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        cls.ensure_loaded()
         s_class = cls.__name__
         return DATA[s_class].get(id)
 
+    @classmethod
+    def reindex(cls):
+        """ Rebuild the indexes of the class from DATA
+        """
+        s_class = cls.__name__
+        with INDEX_LOCK:
+            indexes = {}
+            for attribute in cls.indexed_attributes:
+                indexes[attribute] = HashIndex(attribute)
+            for attribute in cls.sorted_attributes:
+                indexes[attribute] = SortedIndex(attribute)
+            for index in indexes.values():
+                index.build(DATA.get(s_class, {}).values())
+            INDEXES[s_class] = indexes
+
+    @classmethod
+    def index(cls, obj: TypeVar('Base')):
+        """ Update the index entries of a saved object
+        """
+        with INDEX_LOCK:
+            for index in INDEXES.get(cls.__name__, {}).values():
+                index.add(obj)
+
+    @classmethod
+    def indexes(cls) -> dict:
+        """ The indexes of the class
+
+        They reflect the saved objects: save(), save_many(), remove() and
+        load_from_file() keep them up to date. An object put in or
+        taken out of DATA directly is not seen until reindex(); only a
+        DATA emptied or refilled wholesale, caught by its size, triggers
+        a rebuild here.
+        """
+        s_class = cls.__name__
+        cls.ensure_loaded()
+        with INDEX_LOCK:
+            indexes = INDEXES.get(s_class)
+            size = len(DATA.get(s_class, {}))
+            if indexes is None or any(len(index) != size
+                                      for index in indexes.values()):
+                cls.reindex()
+                indexes = INDEXES[s_class]
+            return indexes
+
+    @classmethod
+    def query(cls, *predicates: Predicate, order_by: str = None,
+              limit: int = None, after: tuple = None) -> List[TypeVar('Base')]:
+        """ Search all objects matching every predicate
+
+        e.g. User.query(Prefix('email', 'bob'), order_by='-created_at',
+        limit=10). Predicates on indexed attributes narrow the candidates
+        first; see models.query. `after` is the (order_by value, id) of the
+        last object of the previous page.
+        """
+        indexes = cls.indexes()
+        objects = DATA.get(cls.__name__, {})
+        return run_query(objects, indexes, list(predicates),
+                         order_by=order_by, limit=limit, after=after,
+                         lock=INDEX_LOCK)
+
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return cls.query(*(Eq(k, v) for k, v in attributes.items()))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+""" Change events module
+
+`Base.save()`, `save_many()` and `remove()` publish a ChangeEvent on BUS.
+Each subscriber has its own bounded queue: a slow subscriber loses events
+(counted in `dropped`, visible as a gap in `seq`) instead of slowing down
+the writers, and should then reload the data it follows.
+
+Only public attributes are published and diffed: private ones (`_password`,
+`_version`...) never leave the model.
+"""
+import json
+import queue
+from collections import OrderedDict, namedtuple
+from threading import Event, Lock, Thread
+from time import time
+from typing import Dict, List, Optional
+
+ChangeEvent = namedtuple('ChangeEvent',
+                         ['seq', 'model', 'id', 'op', 'fields', 'version',
+                          'timestamp'])
+# Bookkeeping attributes left out of the changed fields
+IGNORED_FIELDS = ('updated_at',)
+
+
+class Subscription():
+    """ Bounded queue of the events received by one subscriber
+    """
+
+    def __init__(self, bus: 'EventBus', max_queue: int):
+        """ Initialize an empty queue
+        """
+        self.bus = bus
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+
+    def offer(self, event: ChangeEvent):
+        """ Queue an event without blocking; drop it if the queue is full
+        """
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def get(self, timeout: float = None) -> Optional[ChangeEvent]:
+        """ Next event, or None after `timeout` seconds without one
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self) -> List[ChangeEvent]:
+        """ All the queued events, without waiting
+        """
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        """ Stop receiving events
+        """
+        self.bus.unsubscribe(self)
+
+
+class EventBus():
+    """ In-process publish/subscribe of change events
+    """
+
+    def __init__(self, max_states: int = 10000):
+        """ Initialize a bus without subscribers
+
+        `max_states` bounds the LRU of last published states, used to diff
+        objects changed in place; a miss reports all their fields.
+        """
+        self.seq = 0
+        self.max_states = max_states
+        self._subscriptions: List[Subscription] = []
+        self._states: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def active(self) -> bool:
+        """ True if someone listens
+        """
+        return bool(self._subscriptions)
+
+    def subscribe(self, max_queue: int = 10000) -> Subscription:
+        """ New subscription receiving the events published from now on
+        """
+        subscription = Subscription(self, max_queue)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """ Remove a subscription; the last one clears the saved states
+        """
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions
+                                   if s is not subscription]
+            if not self._subscriptions:
+                self._states.clear()
+
+    def publish(self, model: str, obj_id: str, op: str,
+                state: dict = None, version: int = None,
+                previous: dict = None):
+        """ Publish a change to every subscriber
+
+        `state` holds the public attributes of the object after the change
+        (None for a delete) and `previous` those before it, when the
+        caller still has them. Otherwise the changed fields are computed
+        against the state of the object at its previous event, if it is
+        still in the LRU, and are all its fields if not.
+        """
+        if not self._subscriptions:
+            return
+        key = (model, obj_id)
+        with self._lock:
+            cached = self._states.pop(key, None)
+            if previous is None:
+                previous = cached
+            if state is None:
+                fields = sorted(previous) if previous else []
+            else:
+                self._states[key] = state
+                while len(self._states) > self.max_states:
+                    self._states.popitem(last=False)
+                fields = sorted(k for k, v in state.items()
+                                if k not in IGNORED_FIELDS and
+                                (previous is None or previous.get(k) != v))
+            self.seq += 1
+            event = ChangeEvent(self.seq, model, obj_id, op, fields,
+                                version, time())
+            subscriptions = self._subscriptions
+        for subscription in subscriptions:
+            subscription.offer(event)
+
+
+class FileSink(Thread):
+    """ Appends the events of a subscription to a file, one JSON per line
+
+    Other local processes follow the changes by tailing the file.
+    """
+
+    def __init__(self, bus: 'EventBus', file_path: str,
+                 max_queue: int = 10000):
+        """ Subscribe to the bus; `start` launches the writer thread
+        """
+        super().__init__(name="event-file-sink", daemon=True)
+        self.file_path = file_path
+        self.subscription = bus.subscribe(max_queue)
+        self._stopped = Event()
+
+    def run(self):
+        """ Write the events in batches until stopped
+        """
+        with open(self.file_path, 'a') as f:
+            while not self._stopped.is_set():
+                event = self.subscription.get(timeout=0.5)
+                if event is None:
+                    continue
+                for e in [event] + self.subscription.drain():
+                    f.write(json.dumps(e._asdict()) + "\n")
+                f.flush()
+
+    def stop(self):
+        """ Stop writing and unsubscribe
+        """
+        self._stopped.set()
+        self.subscription.close()
+
+
+BUS = EventBus()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+""" Password hashers module
+
+Stored passwords are tagged with their algorithm (`scrypt$...`,
+`bcrypt$...`, `import$...` for bulk imports awaiting their first login);
+an untagged 64-character hex digest is a legacy SHA-256.
+"""
+import base64
+import hashlib
+import hmac
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Dict, Tuple
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+
+class Hasher(ABC):
+    """ Base class of the password hashers
+    """
+    algorithm = None
+    # True if encode() runs outside the GIL, so threads hash in parallel
+    releases_gil = False
+
+    @abstractmethod
+    def encode(self, pwd: str) -> str:
+        """ Hash a password, tagged with the algorithm
+        """
+
+    @abstractmethod
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against its hash, in constant time
+        """
+
+    def needs_update(self, encoded: str) -> bool:
+        """ True if the hash uses weaker parameters than the current ones
+        """
+        return False
+
+
+class SHA256LegacyHasher(Hasher):
+    """ Unsalted SHA-256, kept to verify and upgrade old passwords
+    """
+    algorithm = "sha256"
+
+    def encode(self, pwd: str) -> str:
+        """ Hash a password as an untagged hex digest
+        """
+        return hashlib.sha256(pwd.encode()).hexdigest().lower()
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against its hex digest
+        """
+        return hmac.compare_digest(self.encode(pwd), encoded.lower())
+
+
+class ScryptHasher(Hasher):
+    """ Salted scrypt from the standard library
+    """
+    algorithm = "scrypt"
+    releases_gil = True
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1):
+        """ Initialize with the scrypt cost parameters
+        """
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def _derive(self, pwd: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        """ Derive the 32-byte key of a password
+        """
+        return hashlib.scrypt(pwd.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def encode(self, pwd: str) -> str:
+        """ Hash a password with a new salt: `scrypt$n$r$p$salt$key`
+        """
+        salt = os.urandom(16)
+        key = self._derive(pwd, salt, self.n, self.r, self.p)
+        return "$".join([self.algorithm, str(self.n), str(self.r),
+                         str(self.p), base64.b64encode(salt).decode(),
+                         base64.b64encode(key).decode()])
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against its scrypt hash
+        """
+        try:
+            _, n, r, p, salt, key = encoded.split("$")
+            expected = base64.b64decode(key)
+            actual = self._derive(pwd, base64.b64decode(salt),
+                                  int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_update(self, encoded: str) -> bool:
+        """ True if the hash has other cost parameters
+        """
+        return encoded.split("$")[1:4] != [str(self.n), str(self.r),
+                                           str(self.p)]
+
+
+class ImportHasher(Hasher):
+    """ Salted HMAC-SHA256 of bulk-imported passwords: fast enough to
+    import many users at once, and always re-hashed by the default hasher
+    at the first successful login
+    """
+    algorithm = "import"
+
+    def encode(self, pwd: str) -> str:
+        """ Hash a password with a new salt: `import$salt$digest`
+        """
+        salt = os.urandom(16)
+        digest = hmac.new(salt, pwd.encode(), hashlib.sha256).digest()
+        return "$".join([self.algorithm, base64.b64encode(salt).decode(),
+                         base64.b64encode(digest).decode()])
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against its import hash
+        """
+        try:
+            _, salt, digest = encoded.split("$")
+            expected = base64.b64decode(digest)
+            actual = hmac.new(base64.b64decode(salt), pwd.encode(),
+                              hashlib.sha256).digest()
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_update(self, encoded: str) -> bool:
+        """ Always: an import hash is only kept until the first login
+        """
+        return True
+
+
+class BcryptHasher(Hasher):
+    """ bcrypt, available when the bcrypt package is installed
+    """
+    algorithm = "bcrypt"
+    releases_gil = True
+
+    def __init__(self, rounds: int = 12):
+        """ Initialize with the bcrypt cost factor
+        """
+        self.rounds = rounds
+
+    def encode(self, pwd: str) -> str:
+        """ Hash a password with a new salt: `bcrypt$<bcrypt hash>`
+        """
+        hashed = bcrypt.hashpw(pwd.encode(), bcrypt.gensalt(self.rounds))
+        return "{}${}".format(self.algorithm, hashed.decode())
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against its bcrypt hash
+        """
+        try:
+            return bcrypt.checkpw(pwd.encode(),
+                                  encoded[len(self.algorithm) + 1:].encode())
+        except ValueError:
+            return False
+
+    def needs_update(self, encoded: str) -> bool:
+        """ True if the hash has another cost factor
+        """
+        return encoded.split("$")[3] != "{:02d}".format(self.rounds)
+
+
+HASHERS: Dict[str, Hasher] = {
+    SHA256LegacyHasher.algorithm: SHA256LegacyHasher(),
+    ImportHasher.algorithm: ImportHasher(),
+    ScryptHasher.algorithm: ScryptHasher(
+        n=int(os.getenv("SCRYPT_N", 2 ** 14))),
+}
+if bcrypt is not None:
+    HASHERS[BcryptHasher.algorithm] = BcryptHasher(
+        rounds=int(os.getenv("BCRYPT_ROUNDS", 12)))
+
+
+def default_hasher() -> Hasher:
+    """ The hasher of new passwords, set by PASSWORD_HASHER (scrypt)
+    """
+    name = os.getenv("PASSWORD_HASHER", ScryptHasher.algorithm)
+    if name not in HASHERS or name == ImportHasher.algorithm:
+        raise ValueError("Unknown or unavailable password hasher: "
+                         "{}".format(name))
+    return HASHERS[name]
+
+
+def import_hasher() -> Hasher:
+    """ The hasher of bulk-imported passwords, set by BULK_PASSWORD_HASHER
+    (import); any other hasher stores final hashes, at its full cost
+    """
+    name = os.getenv("BULK_PASSWORD_HASHER", ImportHasher.algorithm)
+    if name not in HASHERS:
+        raise ValueError("Unknown or unavailable password hasher: "
+                         "{}".format(name))
+    return HASHERS[name]
+
+
+def identify_hasher(encoded: str) -> Hasher:
+    """ The hasher of a stored password, or None if it is unknown
+    """
+    algorithm, sep, _ = encoded.partition("$")
+    if not sep:
+        return HASHERS[SHA256LegacyHasher.algorithm]
+    return HASHERS.get(algorithm)
+
+
+class CredentialCache():
+    """ Bounded TTL/LRU cache of recently verified passwords
+
+    Entries hold an HMAC of the password under a per-process key, never the
+    password, and are bound to the stored hash: changing the password
+    invalidates them.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        """ Initialize an empty cache; max_size 0 disables it
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = Lock()
+
+    def _digest(self, encoded: str, pwd: str) -> bytes:
+        """ Keyed digest of a password and its stored hash
+        """
+        message = "{}\0{}".format(encoded, pwd).encode()
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def contains(self, user_id: str, encoded: str, pwd: str) -> bool:
+        """ True if this password was verified for this hash recently
+        """
+        if self.max_size <= 0:
+            return False
+        digest = self._digest(encoded, pwd)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < monotonic():
+                return False
+            self._entries.move_to_end(user_id)
+        return hmac.compare_digest(entry[0], digest)
+
+    def add(self, user_id: str, encoded: str, pwd: str) -> None:
+        """ Remember a verified password
+        """
+        if self.max_size <= 0:
+            return
+        digest = self._digest(encoded, pwd)
+        with self._lock:
+            self._entries[user_id] = (digest, monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
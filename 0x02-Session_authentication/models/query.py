@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+""" Query module
+
+Predicates for `Base.query` and the planner running them: the most
+selective indexed predicate picks the candidates, the others filter them.
+Hash indexes serve equality; sorted indexes serve ranges, prefixes and
+ordered walks for `order_by` with a limit.
+"""
+import heapq
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from contextlib import nullcontext
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TypeVar
+
+MISSING = object()
+UNHASHABLE = object()
+# Most IDs taken from a sorted index per lock acquisition in an ordered
+# walk: the first batch is the limit, then it doubles up to this size
+WALK_BATCH_SIZE = 256
+
+
+class Predicate(ABC):
+    """ Condition on one attribute
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize on an attribute
+        """
+        self.attribute = attribute
+
+    def value_of(self, obj: TypeVar('Base')):
+        """ The attribute of an object, MISSING if it has none
+        """
+        return getattr(obj, self.attribute, MISSING)
+
+    @abstractmethod
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ True if the object satisfies the condition
+        """
+
+
+class Eq(Predicate):
+    """ attribute == value
+    """
+
+    def __init__(self, attribute: str, value):
+        """ Initialize with the expected value
+        """
+        super().__init__(attribute)
+        self.value = value
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ True if the attribute equals the value
+        """
+        return self.value_of(obj) == self.value
+
+
+class In(Predicate):
+    """ attribute in values
+    """
+
+    def __init__(self, attribute: str, values: Iterable):
+        """ Initialize with the accepted values
+        """
+        super().__init__(attribute)
+        self.values = list(values)
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ True if the attribute is one of the values
+        """
+        return self.value_of(obj) in self.values
+
+
+class Prefix(Predicate):
+    """ attribute starts with prefix (strings only)
+    """
+
+    def __init__(self, attribute: str, prefix: str):
+        """ Initialize with the prefix
+        """
+        super().__init__(attribute)
+        self.prefix = prefix
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ True if the attribute is a string starting with the prefix
+        """
+        value = self.value_of(obj)
+        return isinstance(value, str) and value.startswith(self.prefix)
+
+
+class Range(Predicate):
+    """ low <= attribute < high; a missing bound is open
+    """
+
+    def __init__(self, attribute: str, low=None, high=None):
+        """ Initialize with the bounds
+        """
+        super().__init__(attribute)
+        self.low = low
+        self.high = high
+
+    def matches(self, obj: TypeVar('Base')) -> bool:
+        """ True if the attribute is within the bounds
+        """
+        value = self.value_of(obj)
+        if value is MISSING or value is None:
+            return False
+        try:
+            return (self.low is None or value >= self.low) and \
+                (self.high is None or value < self.high)
+        except TypeError:
+            return False
+
+
+class HashIndex():
+    """ Index of the object IDs by value of one attribute
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index
+        """
+        self.attribute = attribute
+        self.ids_by_value: Dict[object, Set[str]] = {}
+        self.value_by_id: Dict[str, object] = {}
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index an object, replacing its previous entry
+        """
+        self.discard(obj.id)
+        value = getattr(obj, self.attribute, MISSING)
+        try:
+            self.ids_by_value.setdefault(value, set()).add(obj.id)
+        except TypeError:
+            # Only found by scans: disables the index
+            value = UNHASHABLE
+            self.ids_by_value.setdefault(value, set()).add(obj.id)
+        self.value_by_id[obj.id] = value
+
+    def build(self, objs: Iterable[TypeVar('Base')]):
+        """ Index all the objects of an empty index
+        """
+        for obj in objs:
+            self.add(obj)
+
+    def discard(self, obj_id: str):
+        """ Remove the entry of an object
+        """
+        if obj_id not in self.value_by_id:
+            return
+        value = self.value_by_id.pop(obj_id)
+        ids = self.ids_by_value[value]
+        ids.discard(obj_id)
+        if not ids:
+            del self.ids_by_value[value]
+
+    def __len__(self) -> int:
+        """ Number of indexed objects
+        """
+        return len(self.value_by_id)
+
+    def lookup(self, predicate: Predicate) -> Optional[List[str]]:
+        """ IDs of the candidates of a predicate, None if not served
+        """
+        if UNHASHABLE in self.ids_by_value:
+            return None
+        try:
+            if isinstance(predicate, Eq):
+                return list(self.ids_by_value.get(predicate.value, ()))
+            if isinstance(predicate, In):
+                ids = []
+                for value in set(predicate.values):
+                    ids.extend(self.ids_by_value.get(value, ()))
+                return ids
+        except TypeError:
+            return None
+        return None
+
+
+class SortedIndex():
+    """ Index of (value, ID) pairs of one attribute, kept sorted with bisect
+
+    Objects whose value is None (or missing) are kept apart: they match no
+    range and come last in an ordered walk.
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index
+        """
+        self.attribute = attribute
+        self.entries: List[tuple] = []
+        self.value_by_id: Dict[str, object] = {}
+        self.none_ids: Set[str] = set()
+        self.broken = False
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index an object, replacing its previous entry: O(log N) search
+        and a memmove of the array
+        """
+        self.discard(obj.id)
+        value = getattr(obj, self.attribute, None)
+        self.value_by_id[obj.id] = value
+        if value is None:
+            self.none_ids.add(obj.id)
+            return
+        try:
+            insort(self.entries, (value, obj.id))
+        except TypeError:
+            # Values that do not compare: disables the index
+            self.broken = True
+
+    def build(self, objs: Iterable[TypeVar('Base')]):
+        """ Index all the objects of an empty index with a single sort,
+        instead of N insertions
+        """
+        for obj in objs:
+            value = getattr(obj, self.attribute, None)
+            self.value_by_id[obj.id] = value
+            if value is None:
+                self.none_ids.add(obj.id)
+            else:
+                self.entries.append((value, obj.id))
+        try:
+            self.entries.sort()
+        except TypeError:
+            self.broken = True
+
+    def discard(self, obj_id: str):
+        """ Remove the entry of an object
+        """
+        if obj_id not in self.value_by_id:
+            return
+        value = self.value_by_id.pop(obj_id)
+        if value is None:
+            self.none_ids.discard(obj_id)
+            return
+        try:
+            i = bisect_left(self.entries, (value, obj_id))
+        except TypeError:
+            return
+        if i < len(self.entries) and self.entries[i] == (value, obj_id):
+            del self.entries[i]
+
+    def __len__(self) -> int:
+        """ Number of indexed objects
+        """
+        return len(self.value_by_id)
+
+    def _bounds(self, low, high) -> tuple:
+        """ Slice of the entries with low <= value < high
+        """
+        start = 0 if low is None else bisect_left(self.entries, (low,))
+        end = len(self.entries) if high is None \
+            else bisect_left(self.entries, (high,))
+        return start, end
+
+    def lookup(self, predicate: Predicate) -> Optional[List[str]]:
+        """ IDs of the candidates of a predicate, None if not served
+        """
+        if self.broken:
+            return None
+        try:
+            if isinstance(predicate, Range):
+                start, end = self._bounds(predicate.low, predicate.high)
+            elif isinstance(predicate, Prefix):
+                if not isinstance(predicate.prefix, str):
+                    return None
+                start, end = self._bounds(predicate.prefix,
+                                          predicate.prefix + "\U0010ffff")
+            elif isinstance(predicate, Eq) and predicate.value is not None:
+                start = bisect_left(self.entries, (predicate.value,))
+                end = bisect_right(self.entries,
+                                   (predicate.value, "\U0010ffff"))
+            else:
+                return None
+        except TypeError:
+            return None
+        return [entry[1] for entry in self.entries[start:end]]
+
+    def walk(self, reverse: bool = False, after: tuple = None) -> \
+            Optional[Iterator[str]]:
+        """ IDs in (value, ID) order, None values last, after a cursor
+
+        Returns None if the index cannot serve ordered walks.
+        """
+        if self.broken:
+            return None
+        entries = self.entries
+        start, end = 0, len(entries)
+        none_ids = sorted(self.none_ids, reverse=reverse)
+        if after is not None:
+            value, obj_id = after
+            if value is None:
+                # The cursor is among the None values
+                return iter([i for i in none_ids
+                             if (i < obj_id if reverse else i > obj_id)])
+            try:
+                if reverse:
+                    end = bisect_left(entries, (value, obj_id))
+                else:
+                    start = bisect_right(entries, (value, obj_id))
+            except TypeError:
+                return None
+        # Positions rather than a slice: a page only costs what it reads
+        if reverse:
+            ordered = (entries[i][1] for i in range(end - 1, start - 1, -1))
+        else:
+            ordered = (entries[i][1] for i in range(start, end))
+        return _chain(ordered, none_ids)
+
+
+def _chain(first: Iterator[str], second: Iterable[str]) -> Iterator[str]:
+    """ Yield from two iterables in turn
+    """
+    yield from first
+    yield from second
+
+
+def plan(indexes: dict, predicates: List[Predicate]) -> tuple:
+    """ Pick the indexed predicate with the fewest candidates
+
+    Returns the predicate and the IDs of its candidates, or (None, None)
+    when no predicate is served by an index and all objects are scanned.
+    """
+    best, best_ids = None, None
+    for predicate in predicates:
+        index = indexes.get(predicate.attribute)
+        ids = index.lookup(predicate) if index is not None else None
+        if ids is not None and (best_ids is None or len(ids) < len(best_ids)):
+            best, best_ids = predicate, ids
+            if not ids:
+                break
+    return best, best_ids
+
+
+def run_query(objects: Dict[str, TypeVar('Base')], indexes: dict,
+              predicates: List[Predicate], order_by: str = None,
+              limit: int = None, after: tuple = None,
+              lock=None) -> List[TypeVar('Base')]:
+    """ Plan and run a query over the objects of a class
+
+    The indexed predicate with the fewest candidates drives the query;
+    without one, all objects are scanned. The predicates are then only
+    evaluated on the candidates. `order_by` is an attribute name,
+    prefixed with `-` for descending order; None values sort last and
+    ties are broken by ID. With a limit and a sorted index on `order_by`,
+    the index is walked in order instead, until enough objects match.
+    `after` is the (value, ID) of the last object of the previous page.
+    `lock` guards the indexes and the objects while the candidates are
+    taken; the predicates are evaluated and the results sorted without it.
+    A limit of 0 or less matches nothing.
+    """
+    if limit is not None and limit <= 0:
+        return []
+    lock = lock if lock is not None else nullcontext()
+    reverse = order_by is not None and order_by.startswith('-')
+    attribute = order_by.lstrip('-') if order_by is not None else None
+
+    with lock:
+        best, best_ids = plan(indexes, predicates)
+        order_index = indexes.get(attribute)
+        page = None
+        if limit is not None and isinstance(order_index, SortedIndex) and \
+                (best is None or best.attribute == attribute):
+            page = _walk_batch(order_index, reverse, after, limit)
+        if page is None:
+            if best is None:
+                candidates = list(objects.values())
+            else:
+                candidates = [o for o in map(objects.get, best_ids)
+                              if o is not None]
+    if page is not None:
+        return _walk_query(objects, order_index, predicates, limit, reverse,
+                           page, lock)
+
+    # The driving predicate is checked again in case an object was
+    # changed without being saved
+    if predicates:
+        candidates = [o for o in candidates
+                      if all(p.matches(o) for p in predicates)]
+    if order_by is None:
+        return candidates if limit is None else candidates[:limit]
+
+    def sort_key(obj):
+        value = getattr(obj, attribute, None)
+        return (value is None) != reverse, value, obj.id
+
+    if after is not None:
+        cursor = ((after[0] is None) != reverse, after[0], after[1])
+        if reverse:
+            candidates = [o for o in candidates if sort_key(o) < cursor]
+        else:
+            candidates = [o for o in candidates if sort_key(o) > cursor]
+    if limit is None:
+        return sorted(candidates, key=sort_key, reverse=reverse)
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    return select(limit, candidates, key=sort_key)
+
+
+def _walk_batch(index: SortedIndex, reverse: bool, after: tuple,
+                size: int) -> Optional[tuple]:
+    """ Next `size` IDs of an ordered walk, called with the indexes locked
+
+    Returns the IDs and the cursor after the last one, or None if the
+    index cannot serve the walk.
+    """
+    ids = index.walk(reverse, after)
+    if ids is None:
+        return None
+    ids = list(islice(ids, size))
+    if not ids:
+        return ids, after
+    return ids, (index.value_by_id.get(ids[-1]), ids[-1])
+
+
+def _walk_query(objects: Dict[str, TypeVar('Base')], index: SortedIndex,
+                predicates: List[Predicate], limit: int, reverse: bool,
+                page: tuple, lock) -> List[TypeVar('Base')]:
+    """ Filter an ordered walk batch by batch, until `limit` objects match;
+    the lock is only taken to fetch the next batch
+    """
+    matches = []
+    size = limit
+    while page is not None:
+        ids, cursor = page
+        for obj in map(objects.get, ids):
+            if obj is not None and all(p.matches(obj) for p in predicates):
+                matches.append(obj)
+                if len(matches) == limit:
+                    return matches
+        if not ids or len(ids) < size:
+            break
+        size = max(limit, min(size * 2, WALK_BATCH_SIZE))
+        with lock:
+            page = _walk_batch(index, reverse, cursor, size)
+    return matches
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+""" Stats module
+
+Aggregates kept up to date as the data changes, so reading them is O(1):
+per-class object counts and creations per day, maintained by `Base.save()`,
+`save_many()`, `remove()` and `load_from_file()`, and named COUNTERS such
+as sessions and authentication failures.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, Iterable, TypeVar
+
+
+class ModelStats():
+    """ Count and creations per day of the objects of one class
+    """
+
+    def __init__(self):
+        """ Initialize empty aggregates
+        """
+        self.count = 0
+        self.created_per_day: Counter = Counter()
+        self._lock = Lock()
+
+    @staticmethod
+    def day_of(obj: TypeVar('Base')) -> str:
+        """ Creation day of an object, YYYY-MM-DD
+        """
+        created_at = getattr(obj, 'created_at', None)
+        return created_at.strftime("%Y-%m-%d") if created_at else None
+
+    def added(self, obj: TypeVar('Base')):
+        """ Account for a new object
+        """
+        day = self.day_of(obj)
+        with self._lock:
+            self.count += 1
+            if day is not None:
+                self.created_per_day[day] += 1
+
+    def removed(self, obj: TypeVar('Base')):
+        """ Account for a removed object
+        """
+        day = self.day_of(obj)
+        with self._lock:
+            self.count -= 1
+            if day is not None:
+                self.created_per_day[day] -= 1
+                if self.created_per_day[day] <= 0:
+                    del self.created_per_day[day]
+
+    def replaced(self, old: TypeVar('Base'), new: TypeVar('Base')):
+        """ Account for an object saved over its stored version
+        """
+        if self.day_of(old) != self.day_of(new):
+            self.removed(old)
+            self.added(new)
+
+    def reset(self, objs: Iterable[TypeVar('Base')]):
+        """ Recompute the aggregates from all the objects: O(N)
+        """
+        objs = list(objs)
+        created_per_day = Counter(filter(None, map(self.day_of, objs)))
+        with self._lock:
+            self.created_per_day = created_per_day
+            self.count = len(objs)
+
+    def snapshot(self, days: int = None) -> dict:
+        """ Copy of the aggregates, with the creations of the last `days`
+        calendar days (UTC, today included) only
+        """
+        with self._lock:
+            per_day = sorted(self.created_per_day.items())
+            count = self.count
+        if days is not None:
+            since = (datetime.utcnow() - timedelta(days=days - 1)) \
+                .strftime("%Y-%m-%d")
+            per_day = [(day, n) for day, n in per_day
+                       if day >= since] if days > 0 else []
+        return {'count': count, 'created_per_day': dict(per_day)}
+
+
+class Counters():
+    """ Named event counters and gauges
+    """
+
+    def __init__(self):
+        """ Initialize with every counter at 0
+        """
+        self._values: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def incr(self, name: str, n: int = 1):
+        """ Add n (negative to decrement) to a counter
+        """
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + n
+
+    def get(self, name: str) -> int:
+        """ Current value of a counter
+        """
+        return self._values.get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """ Copy of all the counters
+        """
+        with self._lock:
+            return dict(self._values)
+
+
+MODEL_STATS: Dict[str, ModelStats] = {}
+COUNTERS = Counters()
+
+
+def model_stats(s_class: str) -> ModelStats:
+    """ Aggregates of a class, created on first use
+    """
+    stats = MODEL_STATS.get(s_class)
+    if stats is None:
+        stats = MODEL_STATS.setdefault(s_class, ModelStats())
+    return stats
@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
+import os
 from models.base import Base
+from models.hashers import CredentialCache, default_hasher, identify_hasher
 
 
 class User(Base):
     """ User class
     """
+    indexed_attributes = ('email',)
+    credential_cache = CredentialCache(
+        int(os.getenv("PASSWORD_CACHE_SIZE", 10000)),
+        float(os.getenv("PASSWORD_CACHE_TTL", 300)))
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
@@ -17,6 +22,8 @@ class User(Base):
         self._password = kwargs.get('_password')
         self.first_name = kwargs.get('first_name')
         self.last_name = kwargs.get('last_name')
+        # Signed sessions: incremented to revoke all the user's tokens
+        self._session_version = kwargs.get('_session_version', 0)
 
     @property
     def password(self) -> str:
@@ -26,22 +33,47 @@ class User(Base):
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hashed by the default hasher
         """
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            self._password = User.hash_password(pwd)
 
-    def is_valid_password(self, pwd: str) -> bool:
+    def is_valid_password(self, pwd: str, upgrade: bool = False) -> bool:
         """ Validate a password
+
+        A password verified recently is accepted from the credential
+        cache. With `upgrade` (a session login or a Basic check), a valid
+        password stored with another hasher or weaker parameters than the
+        default is re-hashed once and saved without changing the user's
+        version, so its ETag stays valid.
         """
         if pwd is None or type(pwd) is not str:
             return False
-        if self.password is None:
+        encoded = self.password
+        if encoded is None:
+            return False
+        hasher = identify_hasher(encoded)
+        default = default_hasher()
+        outdated = upgrade and (hasher is not default or
+                                default.needs_update(encoded))
+        if User.credential_cache.contains(self.id, encoded, pwd):
+            if not outdated:
+                return True
+        elif hasher is None or not hasher.verify(pwd, encoded):
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        if outdated:
+            self._password = default.encode(pwd)
+            self.save(touch=False)
+        User.credential_cache.add(self.id, self._password, pwd)
+        return True
+
+    @staticmethod
+    def hash_password(pwd: str) -> str:
+        """ Hash a password as stored in `_password`
+        """
+        return default_hasher().encode(pwd)
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
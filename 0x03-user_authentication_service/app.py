@@ -6,9 +6,32 @@ This application allows users to register, log in, view profiles, and reset pass
 
 from flask import Flask, jsonify, request, abort, redirect
 from auth import Auth
+from hashing import PoolSaturated
+from purge import ExpiryPurger
 
 AUTH = Auth()
 app = Flask(__name__)
+PURGER = ExpiryPurger(AUTH._db)
+
+def start_purger() -> None:
+    """Start the expiry purge thread, unless PURGE_INTERVAL is 0.
+
+    Called by `__main__`; under a pre-forking server, call it from a hook
+    run in each worker (e.g. gunicorn's post_fork), since threads do not
+    survive a fork.
+    """
+    if PURGER.interval > 0 and not PURGER.is_alive():
+        PURGER.start()
+
+@app.teardown_appcontext
+def remove_db_session(exception=None) -> None:
+    """Release the database session of the request thread."""
+    AUTH._db.remove_session()
+
+@app.errorhandler(PoolSaturated)
+def hashing_pool_saturated(error) -> str:
+    """Fail fast with a 503 when the password hashing pool is full."""
+    return jsonify({"message": "server busy"}), 503, {"Retry-After": "1"}
 
 @app.route('/', methods=['GET'])
 def index() -> str:
@@ -131,4 +154,5 @@ def update_password() -> str:
         abort(403)
 
 if __name__ == "__main__":
+    start_purger()
     app.run(host="0.0.0.0", port="5000")
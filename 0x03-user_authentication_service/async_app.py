@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Asyncio (ASGI) variant of the user authentication service.
+It serves the same routes as app.py with Quart, on top of AsyncAuth, so a
+single process can keep thousands of idle connections open while database
+calls and bcrypt run off the event loop.
+
+Run it with an ASGI server, e.g.: hypercorn async_app:app --bind 0.0.0.0:5000
+"""
+
+import asyncio
+import logging
+from os import getenv
+from quart import Quart, jsonify, request, abort, redirect
+from async_auth import AsyncAuth
+from hashing import PoolSaturated
+
+AUTH = AsyncAuth()
+app = Quart(__name__)
+PURGE_INTERVAL = float(getenv("PURGE_INTERVAL", 300))
+PURGE_BATCH_SIZE = int(getenv("PURGE_BATCH_SIZE", 1000))
+logger = logging.getLogger(__name__)
+
+async def purge_expired() -> None:
+    """Clear expired reset tokens and sessions every PURGE_INTERVAL."""
+    while True:
+        await asyncio.sleep(PURGE_INTERVAL)
+        try:
+            await AUTH._db.purge_expired(batch_size=PURGE_BATCH_SIZE)
+        except Exception:
+            logger.exception("Expiry purge failed")
+
+@app.before_serving
+async def init_db() -> None:
+    """Bring the database schema up to date before serving."""
+    await AUTH.init()
+    if PURGE_INTERVAL > 0:
+        app.purge_task = asyncio.ensure_future(purge_expired())
+
+@app.after_serving
+async def stop_purge() -> None:
+    """Stop the purge task."""
+    task = getattr(app, "purge_task", None)
+    if task is not None:
+        task.cancel()
+
+@app.errorhandler(PoolSaturated)
+async def hashing_pool_saturated(error) -> str:
+    """Fail fast with a 503 when the password hashing pool is full."""
+    return jsonify({"message": "server busy"}), 503, {"Retry-After": "1"}
+
+@app.route('/', methods=['GET'])
+async def index() -> str:
+    """Return a welcome message.
+
+    Returns:
+        str: JSON response with a welcome message.
+    """
+    return jsonify({"message": "Bienvenue"})
+
+@app.route('/users', methods=['POST'])
+async def users() -> str:
+    """Register a new user.
+
+    Returns:
+        str: JSON response with user email and success message or an error message.
+    """
+    form = await request.form
+    email = form.get('email')
+    password = form.get('password')
+
+    try:
+        user = await AUTH.register_user(email, password)
+        return jsonify({"email": user.email, "message": "user created"})
+    except ValueError:
+        return jsonify({"message": "email already registered"}), 400
+
+@app.route('/sessions', methods=['POST'])
+async def login() -> str:
+    """Log in a user and set the session ID cookie.
+
+    Returns:
+        str: JSON response with user email and success message.
+    """
+    form = await request.form
+    email = form.get('email')
+    password = form.get('password')
+
+    if not await AUTH.valid_login(email, password):
+        abort(401)
+    session_id = await AUTH.create_session(email)
+    response = jsonify({"email": email, "message": "logged in"})
+    response.set_cookie('session_id', session_id)
+    return response
+
+@app.route('/sessions', methods=['DELETE'])
+async def logout() -> str:
+    """Log out a user by destroying their session.
+
+    Returns:
+        str: Redirect to the index page.
+    """
+    session_id = request.cookies.get('session_id')
+    user = await AUTH.get_user_from_session_id(session_id)
+    if not user:
+        abort(403)
+    await AUTH.destroy_session(user.id)
+    return redirect('/')
+
+@app.route('/profile', methods=['GET'])
+async def profile() -> str:
+    """Get the profile of the logged-in user.
+
+    Returns:
+        str: JSON response with user email.
+    """
+    session_id = request.cookies.get('session_id')
+    user = await AUTH.get_user_from_session_id(session_id)
+    if not user:
+        abort(403)
+    return jsonify({"email": user.email}), 200
+
+@app.route('/reset_password', methods=['POST'])
+async def get_reset_password_token() -> str:
+    """Request a password reset token.
+
+    Returns:
+        str: JSON response with user email and reset token.
+    """
+    form = await request.form
+    email = form.get('email')
+    try:
+        reset_token = await AUTH.get_reset_password_token(email)
+        return jsonify({"email": email, "reset_token": reset_token}), 200
+    except ValueError:
+        abort(403)
+
+@app.route('/reset_password', methods=['PUT'])
+async def update_password() -> str:
+    """Update the user's password using a reset token.
+
+    Returns:
+        str: JSON response with user email and success message.
+    """
+    form = await request.form
+    email = form.get('email')
+    reset_token = form.get('reset_token')
+    new_password = form.get('new_password')
+    try:
+        await AUTH.update_password(reset_token, new_password)
+        return jsonify({"email": email, "message": "Password updated"}), 200
+    except ValueError:
+        abort(403)
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
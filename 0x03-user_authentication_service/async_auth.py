@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Async Auth module
+This module provides AsyncAuth, an asyncio facade exposing the same API as
+Auth on top of AsyncDB. It shares the rules of BaseAuth with Auth; hashing
+runs on the shared bcrypt pool and session lookups go through the same
+session cache.
+"""
+
+from auth_base import BaseAuth
+from cache import UserSnapshot
+from async_db import AsyncDB
+from user import User
+from sqlalchemy.exc import IntegrityError
+
+
+class AsyncAuth(BaseAuth):
+    """Asyncio facade of Auth: the same methods, as coroutines."""
+
+    def __init__(self):
+        """Initialize the AsyncAuth class with an async database instance.
+        `init` must be awaited before the first call.
+        """
+        super().__init__()
+        self._db = AsyncDB()
+
+    async def init(self) -> None:
+        """Bring the database schema up to date."""
+        await self._db.init_schema()
+
+    async def register_user(self, email: str, password: str) -> User:
+        """Register a new user in the database.
+
+        Args:
+            email (str): The email of the user.
+            password (str): The password of the user.
+
+        Returns:
+            User: The created User object.
+
+        Raises:
+            ValueError: If a user with the same email already exists.
+        """
+        if await self._db.first_user_by(email=email) is not None:
+            raise ValueError(f"User {email} already exists.")
+        hashed_password = await self._hasher.hash_password_async(password)
+        try:
+            return await self._db.add_user(email, hashed_password)
+        except IntegrityError:
+            raise ValueError(f"User {email} already exists.")
+
+    async def valid_login(self, email: str, password: str) -> bool:
+        """Check the credentials of a user.
+
+        Args:
+            email (str): The email of the user.
+            password (str): The password to check.
+
+        Returns:
+            bool: True if the user exists and the password matches.
+        """
+        if email is None or password is None:
+            return False
+        user = await self._db.first_user_by(email=email)
+        if user is None:
+            return False
+        return await self._hasher.check_password_async(password,
+                                                       user.hashed_password)
+
+    async def get_user_from_session_id(self, session_id: str) -> User:
+        """Get a user from the session ID.
+
+        Args:
+            session_id (str): The session ID to look up.
+
+        Returns:
+            User: The corresponding User object or None if not found. On a
+            session cache hit, a UserSnapshot with the same id and email.
+        """
+        if session_id is None:
+            return None
+        if self._signer is not None:
+            return await self._user_from_token(session_id)
+        snapshot = self._cached_session(session_id)
+        if snapshot is not None:
+            return snapshot
+        # Read first: a session destroyed during the query is not cached
+        generation = self._sessions.generation()
+        user = await self._db.first_user_by(session_id=session_id)
+        return self._session_user(session_id, user, generation)
+
+    async def _user_from_token(self, token: str) -> UserSnapshot:
+        """Get the user of a signed session token, like Auth.
+
+        Args:
+            token (str): The signed session token.
+
+        Returns:
+            UserSnapshot: The user of the token, or None if the token is
+            invalid, expired or revoked.
+        """
+        claims = self._token_claims(token)
+        if claims is None:
+            return None
+        user_id, version = claims
+        current = self._versions.get(user_id)
+        if current is None:
+            generation = self._versions.generation()
+            user = await self._db.first_user_by(id=user_id)
+            if user is not None:
+                current = (user.session_version, user.email)
+                self._versions.put(user_id, *current, generation)
+        return self._token_user(user_id, version, current)
+
+    async def destroy_session(self, user_id: int) -> None:
+        """Destroy the session for a user.
+
+        Args:
+            user_id (int): The ID of the user whose session will be destroyed.
+        """
+        if user_id is None:
+            return
+        await self._db.update_users(self._closed_session(), id=user_id)
+        self._forget_user(user_id=user_id)
+
+    async def create_session(self, email: str) -> str:
+        """Create a session for the user.
+
+        Args:
+            email (str): The email of the user.
+
+        Returns:
+            str: The session ID, or None if the user does not exist. With
+            SESSION_MODE=signed, a signed token and nothing is written.
+        """
+        if email is None:
+            return None
+        if self._signer is not None:
+            user = await self._db.first_user_by(email=email)
+            if user is None:
+                return None
+            return self._signer.issue(user.id, user.session_version)
+        session_id, values = self._new_session()
+        if not await self._db.update_users(values, email=email):
+            return None
+        self._forget_user(email=email)
+        return session_id
+
+    async def get_reset_password_token(self, email: str) -> str:
+        """Generate a reset password token for a user.
+
+        Args:
+            email (str): The email of the user.
+
+        Returns:
+            str: The generated reset token, valid for RESET_TOKEN_TTL
+            seconds.
+
+        Raises:
+            ValueError: If the user does not exist.
+        """
+        reset_token, values = self._new_reset_token()
+        if email is None or not await self._db.update_users(values,
+                                                            email=email):
+            raise ValueError("User does not exist.")
+        return reset_token
+
+    async def update_password(self, reset_token: str,
+                              new_password: str) -> None:
+        """Update the user's password using a reset token.
+
+        Args:
+            reset_token (str): The reset token, if it has not expired.
+            new_password (str): The new password.
+
+        Raises:
+            ValueError: If the reset token is invalid.
+        """
+        if reset_token is None or new_password is None:
+            raise ValueError("Invalid reset token.")
+        # Bogus tokens are turned away before any costly hashing
+        criteria = self._reset_token_criteria(reset_token)
+        user_ids = await self._db.find_user_ids(*criteria, limit=1)
+        if not user_ids:
+            raise ValueError("Invalid reset token.")
+        hashed_password = await self._hasher.hash_password_async(new_password)
+        # The token stays in the WHERE clause so that it is used only once
+        user_ids = await self._db.update_users(
+            self._password_reset(hashed_password),
+            *self._reset_token_criteria(reset_token), id=user_ids[0])
+        if not user_ids:
+            raise ValueError("Invalid reset token.")
+        for user_id in user_ids:
+            self._forget_user(user_id=user_id)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Async DB module
+This module provides the AsyncDB class, the asyncio counterpart of DB built
+on SQLAlchemy's async engine (aiosqlite for SQLite). It shares the model,
+the schema migration and the query building of the db module.
+"""
+
+from datetime import datetime
+from os import getenv
+from typing import AsyncIterator, List
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.pool import StaticPool
+from db import (DEFAULT_DB_URL, SCHEMA_VERSION, VALID_FIELDS, expiry_purges,
+                read_schema_version, upgrade_schema, user_criteria,
+                users_select, utcnow)
+from user import User
+
+
+def async_url(url: str) -> str:
+    """
+    Converts a database URL to the driver used by the async engine.
+
+    Args:
+        url (str): A URL such as `sqlite:///a.db`.
+
+    Returns:
+        str: The same database with an asyncio driver, e.g.
+        `sqlite+aiosqlite:///a.db`.
+    """
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    return url
+
+
+class AsyncDB:
+    """
+    AsyncDB class.
+    Asyncio version of DB: every method is a coroutine and runs in its own
+    short-lived session, so any number of requests can wait on the database
+    without holding a thread.
+    """
+
+    def __init__(self, url: str = None):
+        """
+        Constructor.
+        Creates the async engine. The schema is brought up to date by
+        `init_schema`, which must be awaited before use.
+
+        Args:
+            url (str): The database URL. Defaults to the DB_URL environment
+                variable, then to the `a.db` SQLite file.
+        """
+        url = async_url(url or getenv("DB_URL", DEFAULT_DB_URL))
+        kwargs = {}
+        if url.startswith("sqlite"):
+            if url in ("sqlite+aiosqlite://",
+                       "sqlite+aiosqlite:///:memory:"):
+                kwargs["poolclass"] = StaticPool
+        else:
+            kwargs["pool_size"] = int(getenv("DB_POOL_SIZE", 5))
+            kwargs["max_overflow"] = int(getenv("DB_MAX_OVERFLOW", 10))
+        self._engine = create_async_engine(url, echo=False, **kwargs)
+        if url.startswith("sqlite"):
+            event.listen(self._engine.sync_engine, "connect",
+                         self._set_sqlite_pragmas)
+        self._sessionmaker = sessionmaker(bind=self._engine,
+                                          class_=AsyncSession,
+                                          expire_on_commit=False)
+
+    @staticmethod
+    def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+        """Enables WAL journaling on every new SQLite connection."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    async def init_schema(self) -> None:
+        """
+        init_schema method.
+        Creates the tables and indexes that are missing and records the
+        schema version, like DB.init_schema.
+        """
+        async with self._engine.connect() as conn:
+            version = await conn.run_sync(read_schema_version)
+        if version == SCHEMA_VERSION:
+            return
+        async with self._engine.begin() as conn:
+            await conn.run_sync(upgrade_schema)
+
+    async def close(self) -> None:
+        """
+        close method.
+        Closes all the pooled connections.
+        """
+        await self._engine.dispose()
+
+    async def add_user(self, email: str, hashed_password: str) -> User:
+        """
+        add_user method.
+        Adds a new user to the database with the given email and hashed password.
+
+        Args:
+            email (str): The email address of the user.
+            hashed_password (str): The hashed password of the user.
+
+        Returns:
+            User: The newly created User object, or None if input is invalid.
+        """
+        if not email or not hashed_password:
+            return
+        user = User(email=email, hashed_password=hashed_password)
+        async with self._sessionmaker() as session:
+            session.add(user)
+            await session.commit()
+        return user
+
+    async def find_user_by(self, **kwargs) -> User:
+        """
+        find_user_by method.
+        Searches for a user in the database based on the provided keyword arguments.
+
+        Args:
+            **kwargs: Arbitrary keyword arguments to filter the user query.
+
+        Returns:
+            User: The User object matching the criteria.
+
+        Raises:
+            InvalidRequestError: If invalid query arguments are provided.
+            NoResultFound: If no user matches the criteria.
+        """
+        if not kwargs or any(x not in VALID_FIELDS for x in kwargs):
+            raise InvalidRequestError
+        async with self._sessionmaker() as session:
+            try:
+                result = await session.execute(
+                    select(User).where(*user_criteria(kwargs)))
+                return result.scalar_one()
+            except Exception:
+                raise NoResultFound
+
+    async def first_user_by(self, **kwargs) -> User:
+        """
+        first_user_by method.
+        Like find_user_by, but returns None when no user matches.
+
+        Args:
+            **kwargs: Arbitrary keyword arguments to filter the user query.
+
+        Returns:
+            User: The first User object matching the criteria, or None.
+        """
+        if not kwargs or any(x not in VALID_FIELDS for x in kwargs):
+            raise InvalidRequestError
+        async with self._sessionmaker() as session:
+            result = await session.execute(
+                select(User).where(*user_criteria(kwargs)).limit(1))
+            return result.scalars().first()
+
+    async def find_users_by(self, columns: List[str] = None,
+                            after_id: int = None, limit: int = None,
+                            batch_size: int = 1000,
+                            **filters) -> AsyncIterator[User]:
+        """
+        find_users_by method.
+        Streams every user matching the filters with a single query, like
+        DB.find_users_by.
+
+        Args:
+            columns (List[str]): The fields to load; the ID is always loaded.
+            after_id (int): Only users with a greater ID.
+            limit (int): The maximum number of users.
+            batch_size (int): The number of rows fetched at a time.
+            **filters: The fields to match and their values.
+
+        Yields:
+            User: The matching users, in ID order.
+
+        Raises:
+            InvalidRequestError: If a column or a filter is invalid.
+        """
+        stmt = users_select(columns, after_id, limit, **filters)
+        async with self._sessionmaker() as session:
+            result = await session.stream_scalars(
+                stmt.execution_options(yield_per=batch_size))
+            async for user in result:
+                yield user
+
+    async def find_user_ids(self, *where, limit: int = None) -> List[int]:
+        """
+        find_user_ids method.
+        Returns the IDs of the users matching SQLAlchemy criteria, without
+        loading the users, like DB.find_user_ids.
+
+        Args:
+            *where: Criteria on User, e.g. a reset token and its expiry.
+            limit (int): The maximum number of IDs.
+
+        Returns:
+            List[int]: The IDs of the matching users, in ID order.
+        """
+        stmt = select(User.id).where(*where).order_by(User.id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        async with self._sessionmaker() as session:
+            result = await session.execute(stmt)
+            return list(result.scalars())
+
+    async def update_users(self, values: dict, *where,
+                           **filters) -> List[int]:
+        """
+        update_users method.
+        Sets `values` on every user matching `filters` with a single
+        UPDATE ... WHERE statement, like DB.update_users.
+
+        Args:
+            values (dict): The fields to set and their new values.
+            *where: Extra SQLAlchemy criteria on User, e.g. an expiry check.
+            **filters: The fields to match and their values.
+
+        Returns:
+            List[int]: The IDs of the updated users.
+
+        Raises:
+            ValueError: If any of the fields to set are invalid.
+            InvalidRequestError: If no filter or an invalid filter is given.
+        """
+        if not values or any(k not in VALID_FIELDS for k in values):
+            raise ValueError
+        if not filters or any(k not in VALID_FIELDS for k in filters):
+            raise InvalidRequestError
+        criteria = user_criteria(filters) + list(where)
+        dialect = self._engine.sync_engine.dialect
+        async with self._sessionmaker() as session:
+            if getattr(dialect, "update_returning", False):
+                stmt = update(User).where(*criteria).values(**values)
+                result = await session.execute(stmt.returning(User.id))
+                ids = list(result.scalars())
+            else:
+                result = await session.execute(
+                    select(User.id).where(*criteria))
+                ids = list(result.scalars())
+                if ids:
+                    await session.execute(
+                        update(User).where(User.id.in_(ids))
+                        .values(**values))
+            await session.commit()
+        return ids
+
+    async def purge_expired(self, now: datetime = None,
+                            batch_size: int = 1000) -> int:
+        """
+        purge_expired method.
+        Clears the expired reset tokens and sessions in batches, like
+        DB.purge_expired.
+
+        Args:
+            now (datetime): The current UTC time. Defaults to utcnow().
+            batch_size (int): The number of users updated per transaction.
+
+        Returns:
+            int: The number of tokens and sessions cleared.
+        """
+        purged = 0
+        for criteria, values in expiry_purges(now or utcnow()):
+            while True:
+                async with self._sessionmaker() as session:
+                    result = await session.execute(
+                        select(User.id).where(*criteria).limit(batch_size))
+                    ids = list(result.scalars())
+                if ids:
+                    purged += len(await self.update_users(values, *criteria,
+                                                          id=ids))
+                if len(ids) < batch_size:
+                    break
+        return purged
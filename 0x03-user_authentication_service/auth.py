@@ -5,15 +5,19 @@ This module provides authentication functionalities including user registration,
 session management, and password reset.
 """
 
+from auth_base import BaseAuth
+from cache import UserSnapshot
 from db import DB
 from user import User
-import uuid
+from sqlalchemy.exc import IntegrityError
 
-class Auth:
-    """Auth class to interact with the authentication database."""
+class Auth(BaseAuth):
+    """Auth class to interact with the authentication database. The rules
+    live in BaseAuth; this class runs the queries and the hashing."""
 
     def __init__(self):
         """Initialize the Auth class with a database instance."""
+        super().__init__()
         self._db = DB()
 
     def register_user(self, email: str, password: str) -> User:
@@ -34,20 +38,47 @@ class Auth:
             raise ValueError(f"User {email} already exists.")
 
         hashed_password = self._hash_password(password)
-        user = self._db.add_user(email, hashed_password)
+        try:
+            user = self._db.add_user(email, hashed_password)
+        except IntegrityError:
+            # Registered concurrently, caught by the unique email index
+            self._db._session.rollback()
+            raise ValueError(f"User {email} already exists.")
         return user
 
     def _hash_password(self, password: str) -> bytes:
-        """Hash a password using bcrypt.
+        """Hash a password using bcrypt on the hashing pool.
 
         Args:
             password (str): The password to hash.
 
         Returns:
             bytes: The hashed password.
+
+        Raises:
+            PoolSaturated: If the hashing pool is full.
+        """
+        return self._hasher.hash_password(password)
+
+    def valid_login(self, email: str, password: str) -> bool:
+        """Check the credentials of a user.
+
+        Args:
+            email (str): The email of the user.
+            password (str): The password to check.
+
+        Returns:
+            bool: True if the user exists and the password matches.
+
+        Raises:
+            PoolSaturated: If the hashing pool is full.
         """
-        import bcrypt
-        return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+        if email is None or password is None:
+            return False
+        user = self._db._session.query(User).filter_by(email=email).first()
+        if user is None:
+            return False
+        return self._hasher.check_password(password, user.hashed_password)
 
     def get_user_from_session_id(self, session_id: str) -> User:
         """Get a user from the session ID.
@@ -56,11 +87,48 @@ class Auth:
             session_id (str): The session ID to look up.
 
         Returns:
-            User: The corresponding User object or None if not found.
+            User: The corresponding User object or None if not found. On a
+            session cache hit, a UserSnapshot with the same id and email.
         """
         if session_id is None:
             return None
-        return self._db._session.query(User).filter_by(session_id=session_id).first()
+        if self._signer is not None:
+            return self._user_from_token(session_id)
+        snapshot = self._cached_session(session_id)
+        if snapshot is not None:
+            return snapshot
+        # Read first: a session destroyed during the query is not cached
+        generation = self._sessions.generation()
+        user = self._db._session.query(User).filter_by(session_id=session_id).first()
+        return self._session_user(session_id, user, generation)
+
+    def _user_from_token(self, token: str) -> UserSnapshot:
+        """Get the user of a signed session token.
+
+        The signature and the expiry are checked first; the session version
+        carried by the token must then match the user's current one, which
+        is read from the version cache and only queried on a miss.
+
+        Args:
+            token (str): The signed session token.
+
+        Returns:
+            UserSnapshot: The user of the token, or None if the token is
+            invalid, expired or revoked.
+        """
+        claims = self._token_claims(token)
+        if claims is None:
+            return None
+        user_id, version = claims
+        current = self._versions.get(user_id)
+        if current is None:
+            generation = self._versions.generation()
+            row = self._db._session.query(
+                User.session_version, User.email).filter_by(id=user_id).first()
+            if row is not None:
+                current = tuple(row)
+                self._versions.put(user_id, *current, generation)
+        return self._token_user(user_id, version, current)
 
     def destroy_session(self, user_id: int) -> None:
         """Destroy the session for a user.
@@ -68,10 +136,10 @@ class Auth:
         Args:
             user_id (int): The ID of the user whose session will be destroyed.
         """
-        user = self._db._session.query(User).filter_by(id=user_id).first()
-        if user:
-            user.session_id = None
-            self._db._session.commit()
+        if user_id is None:
+            return
+        self._db.update_users(self._closed_session(), id=user_id)
+        self._forget_user(user_id=user_id)
 
     def create_session(self, email: str) -> str:
         """Create a session for the user.
@@ -80,15 +148,22 @@ class Auth:
             email (str): The email of the user.
 
         Returns:
-            str: The session ID.
+            str: The session ID, or None if the user does not exist. With
+            SESSION_MODE=signed, a signed token and nothing is written.
         """
-        user = self._db._session.query(User).filter_by(email=email).first()
-        if user:
-            session_id = str(uuid.uuid4())
-            user.session_id = session_id
-            self._db._session.commit()
-            return session_id
-        return None
+        if email is None:
+            return None
+        if self._signer is not None:
+            row = self._db._session.query(
+                User.id, User.session_version).filter_by(email=email).first()
+            if row is None:
+                return None
+            return self._signer.issue(row[0], row[1])
+        session_id, values = self._new_session()
+        if not self._db.update_users(values, email=email):
+            return None
+        self._forget_user(email=email)
+        return session_id
 
     def get_reset_password_token(self, email: str) -> str:
         """Generate a reset password token for a user.
@@ -97,31 +172,40 @@ class Auth:
             email (str): The email of the user.
 
         Returns:
-            str: The generated reset token.
+            str: The generated reset token, valid for RESET_TOKEN_TTL
+            seconds.
 
         Raises:
             ValueError: If the user does not exist.
         """
-        user = self._db._session.query(User).filter_by(email=email).first()
-        if not user:
+        reset_token, values = self._new_reset_token()
+        if email is None or not self._db.update_users(values, email=email):
             raise ValueError("User does not exist.")
-        
-        reset_token = str(uuid.uuid4())
-        user.reset_token = reset_token
-        self._db._session.commit()
         return reset_token
 
     def update_password(self, reset_token: str, new_password: str) -> None:
         """Update the user's password using a reset token.
 
         Args:
-            reset_token (str): The reset token.
+            reset_token (str): The reset token, if it has not expired.
             new_password (str): The new password.
+
+        Raises:
+            ValueError: If the reset token is invalid.
         """
-        user = self._db._session.query(User).filter_by(reset_token=reset_token).first()
-        if user:
-            user.hashed_password = self._hash_password(new_password)
-            user.reset_token = None  # Clear the reset token
-            self._db._session.commit()
-        else:
+        if reset_token is None or new_password is None:
+            raise ValueError("Invalid reset token.")
+        # Bogus tokens are turned away before any costly hashing
+        criteria = self._reset_token_criteria(reset_token)
+        user_ids = self._db.find_user_ids(*criteria, limit=1)
+        if not user_ids:
+            raise ValueError("Invalid reset token.")
+        hashed_password = self._hash_password(new_password)
+        # The token stays in the WHERE clause so that it is used only once
+        user_ids = self._db.update_users(
+            self._password_reset(hashed_password),
+            *self._reset_token_criteria(reset_token), id=user_ids[0])
+        if not user_ids:
             raise ValueError("Invalid reset token.")
+        for user_id in user_ids:
+            self._forget_user(user_id=user_id)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Auth base module
+This module provides BaseAuth, the configuration and the rules shared by
+Auth and AsyncAuth: session and reset token expiry, signed token checks,
+cache bookkeeping and the values written by each operation. The subclasses
+only add the database and hashing I/O, synchronous or asynchronous.
+"""
+
+from os import getenv
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from cache import SessionCache, UserSnapshot, VersionCache
+from db import utcnow
+from hashing import HashingPool
+from tokens import SessionSigner
+from user import User
+import uuid
+
+
+class BaseAuth:
+    """Rules shared by Auth and AsyncAuth, free of I/O."""
+
+    def __init__(self):
+        """Read the settings and create the caches, the hashing pool and
+        the token signer. Subclasses set `_db`.
+        """
+        self._sessions = SessionCache(int(getenv("SESSION_CACHE_SIZE", 10000)),
+                                      float(getenv("SESSION_CACHE_TTL", 60)))
+        self._hasher = HashingPool()
+        self._reset_token_ttl = timedelta(
+            seconds=int(getenv("RESET_TOKEN_TTL", 3600)))
+        self._session_ttl = timedelta(seconds=int(getenv("SESSION_TTL", 0)))
+        self._signer = None
+        if getenv("SESSION_MODE") == "signed":
+            self._signer = SessionSigner(
+                ttl=int(getenv("SESSION_TOKEN_TTL", 86400)))
+        self._versions = VersionCache(
+            int(getenv("SESSION_CACHE_SIZE", 10000)),
+            float(getenv("SESSION_CACHE_TTL", 60)))
+
+    @staticmethod
+    def _expired(expires_at: Optional[datetime]) -> bool:
+        """Check an expiry.
+
+        Args:
+            expires_at (datetime): The expiry, naive UTC, or None.
+
+        Returns:
+            bool: True if it has passed; None never expires.
+        """
+        return expires_at is not None and expires_at <= utcnow()
+
+    def _cached_session(self, session_id: str) -> Optional[UserSnapshot]:
+        """Look up a session in the cache, dropping it if it has expired.
+
+        Args:
+            session_id (str): The session ID.
+
+        Returns:
+            UserSnapshot: The cached user, or None on a miss.
+        """
+        snapshot = self._sessions.get(session_id)
+        if snapshot is not None and self._expired(snapshot.expires_at):
+            self._sessions.invalidate_user(user_id=snapshot.id)
+            return None
+        return snapshot
+
+    def _session_user(self, session_id: str, user: User,
+                      generation: int) -> Optional[User]:
+        """Check the user found for a session ID and cache it.
+
+        Args:
+            session_id (str): The session ID.
+            user (User): The user found by the query, or None.
+            generation (int): The session cache generation read before the
+                query; a session destroyed since is not cached.
+
+        Returns:
+            User: The user, or None if there is none or the session has
+            expired.
+        """
+        if user is None or self._expired(user.session_expires_at):
+            return None
+        self._sessions.put(session_id,
+                           UserSnapshot(user.id, user.email,
+                                        user.session_expires_at),
+                           generation)
+        return user
+
+    def _token_claims(self, token: str) -> Optional[Tuple[int, int]]:
+        """Verify the signature and the expiry of a signed session token.
+
+        Args:
+            token (str): The signed session token.
+
+        Returns:
+            Tuple[int, int]: The user ID and the session version carried by
+            the token, or None if it is invalid or expired.
+        """
+        claims = self._signer.verify(token)
+        if claims is None:
+            return None
+        try:
+            return int(claims[0]), claims[1]
+        except ValueError:
+            return None
+
+    def _token_user(self, user_id: int, version: int,
+                    current: tuple) -> Optional[UserSnapshot]:
+        """Check the session version of a token against the user's one.
+
+        Args:
+            user_id (int): The user ID of the token.
+            version (int): The session version of the token.
+            current (tuple): The user's session version and email, or None
+                if the user does not exist.
+
+        Returns:
+            UserSnapshot: The user of the token, or None if it is revoked.
+        """
+        if current is None or current[0] != version:
+            return None
+        return UserSnapshot(user_id, current[1])
+
+    def _new_session(self) -> Tuple[str, dict]:
+        """Create a session ID and the values that open it.
+
+        Returns:
+            Tuple[str, dict]: The session ID and the fields to set on the
+            user, expiring after SESSION_TTL seconds if it is set.
+        """
+        session_id = str(uuid.uuid4())
+        expires_at = utcnow() + self._session_ttl if self._session_ttl \
+            else None
+        return session_id, {"session_id": session_id,
+                            "session_expires_at": expires_at}
+
+    @staticmethod
+    def _closed_session() -> dict:
+        """Return the values that close every session of a user and revoke
+        their signed tokens."""
+        return {"session_id": None, "session_expires_at": None,
+                "session_version": User.session_version + 1}
+
+    def _new_reset_token(self) -> Tuple[str, dict]:
+        """Create a reset token and the values that store it.
+
+        Returns:
+            Tuple[str, dict]: The token and the fields to set on the user,
+            valid for RESET_TOKEN_TTL seconds.
+        """
+        reset_token = str(uuid.uuid4())
+        return reset_token, {
+            "reset_token": reset_token,
+            "reset_token_expires_at": utcnow() + self._reset_token_ttl}
+
+    @staticmethod
+    def _reset_token_criteria(reset_token: str) -> list:
+        """Return the criteria matching the user of an unexpired reset
+        token."""
+        return [User.reset_token == reset_token,
+                User.reset_token_expires_at > utcnow()]
+
+    @staticmethod
+    def _password_reset(hashed_password: bytes) -> dict:
+        """Return the values of a password reset: the new hash, the token
+        used up and the signed sessions revoked."""
+        return {"hashed_password": hashed_password, "reset_token": None,
+                "reset_token_expires_at": None,
+                "session_version": User.session_version + 1}
+
+    def _forget_user(self, user_id: int = None, email: str = None) -> None:
+        """Drop the cached session and session version of a user.
+
+        Args:
+            user_id (int): The ID of the user.
+            email (str): The email of the user.
+        """
+        self._sessions.invalidate_user(user_id=user_id, email=email)
+        if user_id is not None:
+            self._versions.invalidate(user_id)
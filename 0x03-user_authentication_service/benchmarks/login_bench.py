@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark of POST /sessions under concurrent logins.
+
+Registers users in an in-memory database, then fires logins from
+`--concurrency` threads at once and reports the p50/p99 latency of the
+successful logins and the number of fast 503 rejections from the bounded
+hashing pool.
+
+Usage (from the project directory):
+    python3 benchmarks/login_bench.py --concurrency 200 --rounds 12
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """ Returns the nearest-rank percentile of a sorted list. """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, int(round(pct / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def main(argv: List[str] = None) -> None:
+    """ Entry point of the benchmark. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=12,
+                        help="bcrypt cost factor")
+    args = parser.parse_args(argv)
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+
+    from app import app, AUTH
+
+    emails = ["bench{}@example.com".format(i) for i in range(args.users)]
+    for email in emails:
+        AUTH.register_user(email, "password")
+
+    barrier = Barrier(args.concurrency)
+
+    def login(i: int) -> Tuple[int, float]:
+        client = app.test_client(use_cookies=False)
+        form = {'email': emails[i % len(emails)], 'password': "password"}
+        barrier.wait()
+        start = time.perf_counter()
+        response = client.post('/sessions', data=form)
+        return response.status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(login, range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ok = sorted(lat for status, lat in results if status == 200)
+    busy = sorted(lat for status, lat in results if status == 503)
+    print("{} concurrent logins, bcrypt rounds {}, {:.2f}s".format(
+        args.concurrency, args.rounds, elapsed))
+    print("200: {:>4}  p50 {:>8.1f} ms  p99 {:>8.1f} ms".format(
+        len(ok), percentile(ok, 50) * 1000, percentile(ok, 99) * 1000))
+    print("503: {:>4}  p50 {:>8.1f} ms  p99 {:>8.1f} ms".format(
+        len(busy), percentile(busy, 50) * 1000, percentile(busy, 99) * 1000))
+    other = len(results) - len(ok) - len(busy)
+    if other:
+        print("other statuses: {}".format(other))
+
+
+if __name__ == "__main__":
+    main()
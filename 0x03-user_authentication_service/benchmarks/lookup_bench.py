@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Lookup benchmark for the users table.
+
+Fills a SQLite file with synthetic users, then times the `filter_by` lookups
+made by `Auth` on email, session_id and reset_token, first without the
+lookup indexes and then with them.
+
+Usage (from the project directory):
+    python3 benchmarks/lookup_bench.py --users 1000000 --lookups 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from user import Base, User  # noqa: E402
+
+COLUMNS = ('email', 'session_id', 'reset_token')
+BATCH_SIZE = 50000
+
+
+def populate(engine, count: int) -> None:
+    """
+    Inserts synthetic users in batches.
+
+    Args:
+        engine: The SQLAlchemy engine.
+        count (int): The number of users.
+    """
+    table = User.__table__
+    with engine.begin() as conn:
+        for start in range(0, count, BATCH_SIZE):
+            conn.execute(table.insert(), [{
+                'email': "user{}@example.com".format(i),
+                'hashed_password': "x",
+                'session_id': "session-{}".format(i),
+                'reset_token': "reset-{}".format(i),
+            } for i in range(start, min(count, start + BATCH_SIZE))])
+
+
+def time_lookups(engine, count: int, lookups: int) -> Dict[str, Dict]:
+    """
+    Times random lookups on each indexed column.
+
+    Args:
+        engine: The SQLAlchemy engine.
+        count (int): The number of users in the table.
+        lookups (int): The number of lookups per column.
+
+    Returns:
+        Dict[str, Dict]: The mean and p99 latency in µs per column.
+    """
+    session = sessionmaker(bind=engine)()
+    values = {
+        'email': "user{}@example.com",
+        'session_id': "session-{}",
+        'reset_token': "reset-{}",
+    }
+    results = {}
+    for column in COLUMNS:
+        latencies: List[float] = []
+        for _ in range(lookups):
+            value = values[column].format(random.randrange(count))
+            start = time.perf_counter()
+            session.query(User).filter_by(**{column: value}).first()
+            latencies.append(time.perf_counter() - start)
+            session.expunge_all()
+        latencies.sort()
+        results[column] = {
+            'mean_us': round(sum(latencies) / len(latencies) * 1e6, 1),
+            'p99_us': round(latencies[int(len(latencies) * 0.99) - 1]
+                            * 1e6, 1),
+        }
+    session.close()
+    return results
+
+
+def main(argv: List[str] = None) -> None:
+    """ Entry point of the benchmark. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="lookup_bench_"), "bench.db")
+    engine = create_engine("sqlite:///{}".format(path))
+    Base.metadata.create_all(engine)
+    for index in User.__table__.indexes:
+        index.drop(bind=engine)
+
+    start = time.perf_counter()
+    populate(engine, args.users)
+    print("inserted {} users in {:.1f}s".format(
+        args.users, time.perf_counter() - start))
+
+    before = time_lookups(engine, args.users, args.lookups)
+    for index in User.__table__.indexes:
+        index.create(bind=engine)
+    after = time_lookups(engine, args.users, args.lookups)
+
+    print("{:<12} {:>14} {:>14} {:>14} {:>14}".format(
+        "column", "scan mean µs", "scan p99 µs", "index mean µs",
+        "index p99 µs"))
+    for column in COLUMNS:
+        print("{:<12} {:>14} {:>14} {:>14} {:>14}".format(
+            column, before[column]['mean_us'], before[column]['p99_us'],
+            after[column]['mean_us'], after[column]['p99_us']))
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
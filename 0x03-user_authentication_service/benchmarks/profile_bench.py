@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of GET /profile with the session cache on and off.
+
+Registers a few users in an in-memory database, opens a session for each
+and sends GET /profile requests with their cookies from a pool of threads.
+
+Usage (from the project directory):
+    python3 benchmarks/profile_bench.py --requests 20000 --concurrency 8
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from app import app, AUTH  # noqa: E402
+from cache import SessionCache  # noqa: E402
+
+
+def run(session_ids: List[str], requests: int, concurrency: int) -> float:
+    """
+    Sends GET /profile requests and returns the throughput in req/s.
+
+    Args:
+        session_ids (List[str]): The session cookies to cycle through.
+        requests (int): The total number of requests.
+        concurrency (int): The number of worker threads.
+    """
+    def worker(worker_id: int) -> None:
+        client = app.test_client(use_cookies=False)
+        for i in range(worker_id, requests, concurrency):
+            cookie = "session_id={}".format(session_ids[i % len(session_ids)])
+            response = client.get('/profile', headers={'Cookie': cookie})
+            assert response.status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+def main(argv: List[str] = None) -> None:
+    """ Entry point of the benchmark. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    session_ids = []
+    for i in range(args.users):
+        email = "bench{}@example.com".format(i)
+        AUTH.register_user(email, "password")
+        session_ids.append(AUTH.create_session(email))
+
+    AUTH._sessions = SessionCache(0)
+    off = run(session_ids, args.requests, args.concurrency)
+    AUTH._sessions = SessionCache()
+    on = run(session_ids, args.requests, args.concurrency)
+
+    print("cache off: {:>10.1f} req/s".format(off))
+    print("cache on:  {:>10.1f} req/s  ({:.2f}x) {}".format(
+        on, on / off, AUTH._sessions.stats()))
+
+
+if __name__ == "__main__":
+    main()
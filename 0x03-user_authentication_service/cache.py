@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Cache module
+This module provides bounded TTL/LRU caches mapping session IDs to a
+lightweight snapshot of their user, and user IDs to their session version,
+so hot sessions skip the ORM.
+"""
+
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from time import monotonic
+
+# expires_at: the session expiry (naive UTC), None if it does not expire
+UserSnapshot = namedtuple('UserSnapshot', ['id', 'email', 'expires_at'],
+                          defaults=(None,))
+
+
+class SessionCache:
+    """Bounded TTL/LRU cache of session ID to UserSnapshot."""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        """Initialize an empty cache.
+
+        Args:
+            max_size (int): The number of sessions kept; 0 disables the cache.
+            ttl (float): The lifetime of an entry in seconds. It bounds how
+                long another worker process may see a destroyed session.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_user_id = {}
+        self._by_email = {}
+        self._generation = 0
+        self._lock = Lock()
+
+    def generation(self) -> int:
+        """Return the invalidation counter, to be read before the database
+        query whose result is put in the cache.
+
+        Returns:
+            int: The counter, incremented by every invalidation.
+        """
+        return self._generation
+
+    def get(self, session_id: str) -> UserSnapshot:
+        """Look up the user of a session.
+
+        Args:
+            session_id (str): The session ID.
+
+        Returns:
+            UserSnapshot: The cached user, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[1] < monotonic():
+                if entry is not None:
+                    self._discard(session_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, session_id: str, snapshot: UserSnapshot,
+            generation: int) -> None:
+        """Cache the user of a session, unless a session was invalidated
+        since `generation` was read: the snapshot may then be stale.
+
+        Args:
+            session_id (str): The session ID.
+            snapshot (UserSnapshot): The user of the session.
+            generation (int): The value of generation() before the query.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._discard(session_id)
+            self._entries[session_id] = (snapshot, monotonic() + self.ttl)
+            self._by_user_id[snapshot.id] = session_id
+            self._by_email[snapshot.email] = session_id
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int = None, email: str = None) -> None:
+        """Drop the cached session of a user, given its ID or its email.
+
+        Args:
+            user_id (int): The ID of the user.
+            email (str): The email of the user.
+        """
+        with self._lock:
+            self._generation += 1
+            for index, key in ((self._by_user_id, user_id),
+                               (self._by_email, email)):
+                session_id = index.get(key) if key is not None else None
+                if session_id is not None:
+                    self._discard(session_id)
+
+    def stats(self) -> dict:
+        """Return the size and the hit/miss counters of the cache."""
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits,
+                    "misses": self.misses}
+
+    def _discard(self, session_id: str) -> None:
+        """Remove an entry and its reverse index; the lock must be held."""
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        snapshot = entry[0]
+        if self._by_user_id.get(snapshot.id) == session_id:
+            del self._by_user_id[snapshot.id]
+        if self._by_email.get(snapshot.email) == session_id:
+            del self._by_email[snapshot.email]
+
+
+class VersionCache:
+    """Bounded TTL/LRU cache of user ID to (session version, email)."""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        """Initialize an empty cache.
+
+        Args:
+            max_size (int): The number of users kept; 0 disables the cache.
+            ttl (float): The lifetime of an entry in seconds. It bounds how
+                long another worker process may accept a revoked token.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = Lock()
+
+    def generation(self) -> int:
+        """Return the invalidation counter, to be read before the database
+        query whose result is put in the cache.
+
+        Returns:
+            int: The counter, incremented by every invalidation.
+        """
+        return self._generation
+
+    def get(self, user_id: int) -> tuple:
+        """Look up the session version of a user.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            tuple: The session version and the email of the user, or None
+            on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[2] < monotonic():
+                self._entries.pop(user_id, None)
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[0], entry[1]
+
+    def put(self, user_id: int, version: int, email: str,
+            generation: int) -> None:
+        """Cache the session version of a user, unless a user was
+        invalidated since `generation` was read.
+
+        Args:
+            user_id (int): The ID of the user.
+            version (int): The current session version of the user.
+            email (str): The email of the user.
+            generation (int): The value of generation() before the query.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[user_id] = (version, email, monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop the cached session version of a user.
+
+        Args:
+            user_id (int): The ID of the user.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
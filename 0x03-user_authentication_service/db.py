@@ -3,16 +3,209 @@
 This module provides the DB class for managing user data in a SQLite database using SQLAlchemy.
 """
 
-from sqlalchemy import create_engine
+from datetime import datetime, timezone
+from os import getenv
+from sqlalchemy import (Column, Integer, Table, create_engine, delete,
+                        event, insert, inspect, or_, select, text,
+                        update)
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import load_only, scoped_session, sessionmaker
+from sqlalchemy.exc import DBAPIError, InvalidRequestError
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.pool import StaticPool
 from user import Base, User
-from typing import TypeVar
+from typing import Iterator, List, TypeVar
 
 # List of valid fields for user queries and updates
-VALID_FIELDS = ['id', 'email', 'hashed_password', 'session_id', 'reset_token']
+VALID_FIELDS = ['id', 'email', 'hashed_password', 'session_id', 'reset_token',
+                'session_version', 'reset_token_expires_at',
+                'session_expires_at']
+
+# Version of the schema described by the models, bumped on every change
+SCHEMA_VERSION = 3
+DEFAULT_DB_URL = "sqlite:///a.db"
+
+schema_info = Table('schema_info', Base.metadata,
+                    Column('version', Integer, nullable=False))
+
+
+def make_engine(url: str) -> Engine:
+    """
+    Creates an engine whose connection pool suits the database.
+
+    SQLite connections are shared between request threads, so the
+    same-thread check is turned off and the file is put in WAL mode to let
+    readers run alongside a writer. An in-memory SQLite database lives in a
+    single connection. Other databases get a bounded pool sized by
+    DB_POOL_SIZE and DB_MAX_OVERFLOW.
+
+    Args:
+        url (str): The SQLAlchemy database URL.
+
+    Returns:
+        Engine: The configured engine.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url, echo=False, pool_pre_ping=True,
+            pool_size=int(getenv("DB_POOL_SIZE", 5)),
+            max_overflow=int(getenv("DB_MAX_OVERFLOW", 10)))
+
+    kwargs = {"connect_args": {"check_same_thread": False, "timeout": 15}}
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        kwargs["poolclass"] = StaticPool
+    engine = create_engine(url, echo=False, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Enables WAL journaling on every new SQLite connection."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return engine
+
+
+def read_schema_version(conn: Connection) -> int:
+    """
+    Reads the schema version recorded in the database.
+
+    Args:
+        conn (Connection): A connection to the database.
+
+    Returns:
+        int: The recorded version, or None for a database created before
+        versioning (or an empty one).
+    """
+    try:
+        return conn.execute(select(schema_info.c.version)).scalar()
+    except DBAPIError:
+        return None
+
+
+def add_missing_columns(conn: Connection) -> None:
+    """
+    Adds the columns of the users model that an existing users table lacks.
+    A new NOT NULL column must have a server default.
+
+    Args:
+        conn (Connection): A connection to the database, in a transaction.
+    """
+    table = User.__table__
+    existing = {column['name']
+                for column in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = "ALTER TABLE {} ADD COLUMN {} {}".format(
+            table.name, column.name, column.type.compile(conn.dialect))
+        if column.server_default is not None:
+            ddl += " DEFAULT {}".format(column.server_default.arg.text)
+        if not column.nullable:
+            ddl += " NOT NULL"
+        conn.execute(text(ddl))
+
+
+def upgrade_schema(conn: Connection) -> None:
+    """
+    Creates the tables, columns and indexes that are missing and records
+    SCHEMA_VERSION. `create_all` only creates missing tables, so the
+    columns and indexes of existing tables are added one by one.
+
+    Args:
+        conn (Connection): A connection to the database, in a transaction.
+
+    Raises:
+        IntegrityError: If existing rows break a unique index, e.g. two
+        users share an email; they must be cleaned up first.
+    """
+    Base.metadata.create_all(conn)
+    add_missing_columns(conn)
+    for index in User.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+    conn.execute(delete(schema_info))
+    conn.execute(insert(schema_info).values(version=SCHEMA_VERSION))
+
+
+def utcnow() -> datetime:
+    """
+    Returns the current UTC time as a naive datetime, the form in which
+    the expiry columns are stored.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def expiry_purges(now: datetime) -> list:
+    """
+    Describes what the expiry purge clears. Reset tokens without an expiry,
+    issued before expiries existed, are cleared as well; sessions without
+    an expiry are kept.
+
+    Args:
+        now (datetime): The current UTC time.
+
+    Returns:
+        list: (criteria, values) pairs: the users matching the criteria
+        get the values.
+    """
+    return [
+        ((User.reset_token.isnot(None),
+          or_(User.reset_token_expires_at.is_(None),
+              User.reset_token_expires_at < now)),
+         {"reset_token": None, "reset_token_expires_at": None}),
+        ((User.session_expires_at < now,),
+         {"session_id": None, "session_expires_at": None}),
+    ]
+
+
+def user_criteria(filters: dict) -> list:
+    """
+    Builds the WHERE criteria matching users on field values. A list or
+    tuple value matches any of its items (IN).
+
+    Args:
+        filters (dict): The fields to match and their values.
+
+    Returns:
+        list: The criteria, to be passed to `where`.
+    """
+    return [getattr(User, k).in_(v) if isinstance(v, (list, tuple))
+            else getattr(User, k) == v for k, v in filters.items()]
+
+
+def users_select(columns: List[str] = None, after_id: int = None,
+                 limit: int = None, **filters):
+    """
+    Builds the SELECT of find_users_by: the users matching `filters` in
+    ID order, loading only `columns`.
+
+    Args:
+        columns (List[str]): The fields to load; the ID is always loaded.
+            Defaults to all of them.
+        after_id (int): Only users with a greater ID, to fetch the next
+            page after the last ID of the previous one.
+        limit (int): The maximum number of users.
+        **filters: The fields to match and their values; a list or tuple
+            value matches any of its items (IN).
+
+    Returns:
+        Select: The statement.
+
+    Raises:
+        InvalidRequestError: If a column or a filter is invalid.
+    """
+    if any(k not in VALID_FIELDS for k in list(filters) + (columns or [])):
+        raise InvalidRequestError
+    stmt = select(User).where(*user_criteria(filters)).order_by(User.id)
+    if columns:
+        stmt = stmt.options(load_only(*(getattr(User, c) for c in columns)))
+    if after_id is not None:
+        stmt = stmt.where(User.id > after_id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
 
 
 class DB:
@@ -22,27 +215,74 @@ class DB:
     finding, and updating users.
     """
 
-    def __init__(self):
+    def __init__(self, url: str = None, reset: bool = None):
         """
         Constructor.
-        Initializes the database engine and creates the necessary tables.
+        Initializes the database engine and brings the schema up to date.
+        Existing data is kept unless a reset is requested.
+
+        Args:
+            url (str): The database URL. Defaults to the DB_URL environment
+                variable, then to the `a.db` SQLite file. Use `sqlite://`
+                for a fast in-memory database, e.g. in tests.
+            reset (bool): Drop all the tables first. Defaults to True when
+                the DB_RESET environment variable is `1`.
         """
-        self._engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self._engine)
-        Base.metadata.create_all(self._engine)
-        self.__session = None
+        if url is None:
+            url = getenv("DB_URL", DEFAULT_DB_URL)
+        if reset is None:
+            reset = getenv("DB_RESET", "0") == "1"
+        self._engine = make_engine(url)
+        if reset:
+            Base.metadata.drop_all(self._engine)
+        self.init_schema()
+        self.__session = scoped_session(
+            sessionmaker(bind=self._engine, expire_on_commit=False))
 
     @property
     def _session(self):
         """
         _session property.
-        Returns a session object for interacting with the database. Creates a new session
-        if one does not already exist.
+        Returns the session of the current thread, creating it on first use.
+        Each request thread gets its own session and pooled connection.
+        """
+        return self.__session()
+
+    def remove_session(self) -> None:
+        """
+        remove_session method.
+        Closes the session of the current thread and returns its connection
+        to the pool. Called at the end of every request.
+        """
+        self.__session.remove()
+
+    def schema_version(self) -> int:
+        """
+        schema_version method.
+        Reads the schema version recorded in the database.
+
+        Returns:
+            int: The recorded version, or None for a database created
+            before versioning (or an empty one).
+        """
+        with self._engine.connect() as conn:
+            return read_schema_version(conn)
+
+    def init_schema(self) -> None:
+        """
+        init_schema method.
+        Creates the tables and indexes that are missing and records the
+        schema version. A database already at SCHEMA_VERSION costs a single
+        query.
+
+        Raises:
+            IntegrityError: If existing rows break a unique index, e.g. two
+            users share an email; they must be cleaned up first.
         """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        if self.schema_version() == SCHEMA_VERSION:
+            return
+        with self._engine.begin() as conn:
+            upgrade_schema(conn)
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """
@@ -87,11 +327,59 @@ class DB:
         except Exception:
             raise NoResultFound
 
+    def find_users_by(self, columns: List[str] = None, after_id: int = None,
+                      limit: int = None, batch_size: int = 1000,
+                      **filters) -> Iterator[User]:
+        """
+        find_users_by method.
+        Bulk form of find_user_by: streams every user matching the filters
+        with a single query, fetching `batch_size` rows at a time, so memory
+        stays bounded however many users match. Users come in ID order;
+        pass the last ID seen as `after_id` to get the next page.
+        
+        Args:
+            columns (List[str]): The fields to load; the ID is always loaded.
+                Defaults to all of them.
+            after_id (int): Only users with a greater ID.
+            limit (int): The maximum number of users.
+            batch_size (int): The number of rows fetched at a time.
+            **filters: The fields to match and their values; a list or tuple
+                value matches any of its items (IN). No filter matches all
+                the users.
+        
+        Returns:
+            Iterator[User]: The matching users.
+        
+        Raises:
+            InvalidRequestError: If a column or a filter is invalid.
+        """
+        stmt = users_select(columns, after_id, limit, **filters)
+        return self._session.execute(
+            stmt.execution_options(yield_per=batch_size)).scalars()
+
+    def find_user_ids(self, *where, limit: int = None) -> List[int]:
+        """
+        find_user_ids method.
+        Returns the IDs of the users matching SQLAlchemy criteria, without
+        loading the users.
+        
+        Args:
+            *where: Criteria on User, e.g. a reset token and its expiry.
+            limit (int): The maximum number of IDs.
+        
+        Returns:
+            List[int]: The IDs of the matching users, in ID order.
+        """
+        stmt = select(User.id).where(*where).order_by(User.id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return list(self._session.execute(stmt).scalars())
+
     def update_user(self, user_id: int, **kwargs) -> None:
         """
         update_user method.
         Updates the attributes of an existing user identified by user_id with the provided
-        keyword arguments.
+        keyword arguments, in a single UPDATE statement.
         
         Args:
             user_id (int): The ID of the user to update.
@@ -99,11 +387,81 @@ class DB:
         
         Raises:
             ValueError: If any of the provided fields are invalid.
+            NoResultFound: If no user has this ID.
         """
+        if any(k not in VALID_FIELDS for k in kwargs):
+            raise ValueError
+        if not kwargs:
+            self.find_user_by(id=user_id)
+            return
+        if not self.update_users(kwargs, id=user_id):
+            raise NoResultFound
+
+    def update_users(self, values: dict, *where, **filters) -> List[int]:
+        """
+        update_users method.
+        Batched form of update_user: sets `values` on every user matching
+        `filters` with a single UPDATE ... WHERE statement, without loading
+        the users first. A list or tuple filter value matches any of its
+        items (IN).
+        
+        Args:
+            values (dict): The fields to set and their new values.
+            *where: Extra SQLAlchemy criteria on User, e.g. an expiry check.
+            **filters: The fields to match and their values.
+        
+        Returns:
+            List[int]: The IDs of the updated users.
+        
+        Raises:
+            ValueError: If any of the fields to set are invalid.
+            InvalidRequestError: If no filter or an invalid filter is given.
+        """
+        if not values or any(k not in VALID_FIELDS for k in values):
+            raise ValueError
+        if not filters or any(k not in VALID_FIELDS for k in filters):
+            raise InvalidRequestError
+        criteria = user_criteria(filters) + list(where)
         session = self._session
-        user = self.find_user_by(id=user_id)
-        for k, v in kwargs.items():
-            if k not in VALID_FIELDS:
-                raise ValueError
-            setattr(user, k, v)
+        if getattr(self._engine.dialect, "update_returning", False):
+            stmt = update(User).where(*criteria).values(**values)
+            ids = list(session.execute(stmt.returning(User.id)).scalars())
+        else:
+            # No UPDATE ... RETURNING on this database: fetch the IDs first
+            ids = list(session.execute(
+                select(User.id).where(*criteria)).scalars())
+            if ids:
+                session.execute(update(User).where(User.id.in_(ids))
+                                .values(**values))
         session.commit()
+        return ids
+
+    def purge_expired(self, now: datetime = None,
+                      batch_size: int = 1000) -> int:
+        """
+        purge_expired method.
+        Clears the expired reset tokens and sessions (see expiry_purges),
+        `batch_size` users per transaction so that the purge never holds a
+        long write lock.
+
+        Args:
+            now (datetime): The current UTC time. Defaults to utcnow().
+            batch_size (int): The number of users updated per transaction.
+
+        Returns:
+            int: The number of tokens and sessions cleared.
+        """
+        purged = 0
+        for criteria, values in expiry_purges(now or utcnow()):
+            while True:
+                ids = list(self._session.execute(
+                    select(User.id).where(*criteria).limit(batch_size))
+                    .scalars())
+                if ids:
+                    # Re-check the criteria: a token may have been renewed
+                    purged += len(self.update_users(values, *criteria,
+                                                    id=ids))
+                if len(ids) < batch_size:
+                    break
+        self._session.commit()
+        return purged
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Hashing module
+This module runs bcrypt hashing and verification on a dedicated, bounded
+pool of worker threads. bcrypt releases the GIL, so the pool bounds the
+CPU spent on hashing; its queue absorbs a few seconds of hashing, and a
+fuller queue is reported at once instead of making every request wait
+longer. Synchronous callers still wait for their job on their own thread;
+the asyncio variants free it.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from math import ceil
+from os import cpu_count, getenv
+from threading import BoundedSemaphore
+from typing import Callable
+import bcrypt
+
+CALIBRATION_ROUNDS = 4
+
+
+def estimate_hash_seconds(rounds: int) -> float:
+    """Estimate the time of one bcrypt hash at a cost factor.
+
+    The cost doubles with each round, so a few hashes at the minimum cost
+    are timed and scaled, in milliseconds rather than a full hash.
+
+    Args:
+        rounds (int): The bcrypt cost factor.
+
+    Returns:
+        float: The estimated seconds per hash on one thread.
+    """
+    salt = bcrypt.gensalt(CALIBRATION_ROUNDS)
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        best = min(best, time.perf_counter() - start)
+    return best * 2 ** max(0, rounds - CALIBRATION_ROUNDS)
+
+
+class PoolSaturated(Exception):
+    """Raised when the hashing pool has no room for another job."""
+
+
+class HashingPool:
+    """Bounded pool of threads running bcrypt."""
+
+    def __init__(self, workers: int = None, max_pending: int = None,
+                 rounds: int = None):
+        """Initialize the pool.
+
+        Args:
+            workers (int): The number of hashing threads. Defaults to
+                HASH_WORKERS, then to the number of CPUs.
+            max_pending (int): The number of jobs running or queued at once.
+                Defaults to HASH_QUEUE_DEPTH, then to the jobs the workers
+                get through in HASH_QUEUE_SECONDS (default 3), and at least
+                4 per worker.
+            rounds (int): The bcrypt cost factor. Defaults to BCRYPT_ROUNDS,
+                then to 12.
+        """
+        if workers is None:
+            workers = int(getenv("HASH_WORKERS", cpu_count() or 1))
+        if rounds is None:
+            rounds = int(getenv("BCRYPT_ROUNDS", 12))
+        if max_pending is None and getenv("HASH_QUEUE_DEPTH"):
+            max_pending = int(getenv("HASH_QUEUE_DEPTH"))
+        if max_pending is None:
+            seconds = float(getenv("HASH_QUEUE_SECONDS", 3))
+            max_pending = max(workers * 4, ceil(
+                workers * seconds / estimate_hash_seconds(rounds)))
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix="bcrypt")
+        self._slots = BoundedSemaphore(max_pending)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue a job on the pool.
+
+        Args:
+            fn (Callable): The function to run.
+            *args: Its arguments.
+
+        Returns:
+            Future: The future result of the job.
+
+        Raises:
+            PoolSaturated: If max_pending jobs are already running or queued.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated("Hashing pool is saturated.")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash_password(self, password: str) -> bytes:
+        """Hash a password with a new salt.
+
+        Args:
+            password (str): The password to hash.
+
+        Returns:
+            bytes: The hashed password.
+        """
+        salt = bcrypt.gensalt(self.rounds)
+        return self.submit(bcrypt.hashpw, password.encode(), salt).result()
+
+    def check_password(self, password: str, hashed_password: bytes) -> bool:
+        """Check a password against its hash.
+
+        Args:
+            password (str): The password to check.
+            hashed_password (bytes): The stored hash.
+
+        Returns:
+            bool: True if the password matches.
+        """
+        if isinstance(hashed_password, str):
+            hashed_password = hashed_password.encode()
+        return self.submit(bcrypt.checkpw, password.encode(),
+                           hashed_password).result()
+
+    async def hash_password_async(self, password: str) -> bytes:
+        """Hash a password with a new salt, without blocking the event loop.
+
+        Args:
+            password (str): The password to hash.
+
+        Returns:
+            bytes: The hashed password.
+        """
+        salt = bcrypt.gensalt(self.rounds)
+        return await asyncio.wrap_future(
+            self.submit(bcrypt.hashpw, password.encode(), salt))
+
+    async def check_password_async(self, password: str,
+                                   hashed_password: bytes) -> bool:
+        """Check a password against its hash, without blocking the event loop.
+
+        Args:
+            password (str): The password to check.
+            hashed_password (bytes): The stored hash.
+
+        Returns:
+            bool: True if the password matches.
+        """
+        if isinstance(hashed_password, str):
+            hashed_password = hashed_password.encode()
+        return await asyncio.wrap_future(
+            self.submit(bcrypt.checkpw, password.encode(), hashed_password))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Purge module
+This module runs DB.purge_expired periodically on a background thread, so
+expired reset tokens and sessions do not pile up in the users table and its
+indexes.
+"""
+
+import logging
+from os import getenv
+from threading import Event, Thread
+from db import DB
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryPurger(Thread):
+    """Daemon thread clearing expired tokens and sessions every interval."""
+
+    def __init__(self, db: DB, interval: float = None,
+                 batch_size: int = None):
+        """Initialize the purger; `start` launches it.
+
+        Args:
+            db (DB): The database to purge.
+            interval (float): The seconds between two purges. Defaults to
+                PURGE_INTERVAL, then to 300.
+            batch_size (int): The number of users updated per transaction.
+                Defaults to PURGE_BATCH_SIZE, then to 1000.
+        """
+        super().__init__(name="expiry-purger", daemon=True)
+        if interval is None:
+            interval = float(getenv("PURGE_INTERVAL", 300))
+        if batch_size is None:
+            batch_size = int(getenv("PURGE_BATCH_SIZE", 1000))
+        self.interval = interval
+        self.batch_size = batch_size
+        self.purged = 0
+        self._db = db
+        self._stopped = Event()
+
+    def run_once(self) -> int:
+        """Purge once.
+
+        Returns:
+            int: The number of tokens and sessions cleared.
+        """
+        try:
+            purged = self._db.purge_expired(batch_size=self.batch_size)
+        finally:
+            self._db.remove_session()
+        self.purged += purged
+        return purged
+
+    def run(self) -> None:
+        """Purge every interval until stopped; errors are logged and wait
+        for the next round."""
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Expiry purge failed")
+
+    def stop(self) -> None:
+        """Stop the thread after the current purge."""
+        self._stopped.set()
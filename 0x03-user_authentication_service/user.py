@@ -2,7 +2,7 @@
 """
 User model
 """
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DateTime, Integer, String, text
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -12,8 +12,12 @@ class User(Base):
     __tablename__ = 'users'
     
     id = Column(Integer, primary_key=True)
-    email = Column(String(250), nullable=False)
+    email = Column(String(250), nullable=False, unique=True, index=True)
     hashed_password = Column(String(250), nullable=False)
-    session_id = Column(String(250), nullable=True)
-    reset_token = Column(String(250), nullable=True)
+    session_id = Column(String(250), nullable=True, unique=True, index=True)
+    reset_token = Column(String(250), nullable=True, unique=True, index=True)
+    reset_token_expires_at = Column(DateTime, nullable=True, index=True)
+    session_expires_at = Column(DateTime, nullable=True, index=True)
+    session_version = Column(Integer, nullable=False, default=0,
+                             server_default=text("0"))
 